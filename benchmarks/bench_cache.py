@@ -0,0 +1,34 @@
+"""Скорость process_stream с InfoCache при разной доле повторов.
+
+Запуск: python benchmarks/bench_cache.py [--packages N]
+"""
+import argparse
+import io
+import time
+
+from common import homework, make_packages
+
+
+def timed(packages: list, cache) -> float:
+    start = time.perf_counter()
+    homework.process_stream(packages, io.StringIO(), cache)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=200000)
+    parser.add_argument('--cache-size', type=int, default=100000)
+    args = parser.parse_args()
+    print('повторы  без кэша, с  с кэшем, с  ускорение  попадания')
+    for ratio in (0.0, 0.5, 0.9, 0.99):
+        packages = make_packages(args.packages, ratio)
+        plain = timed(packages, None)
+        cache = homework.InfoCache(args.cache_size)
+        cached = timed(packages, cache)
+        print(f'{ratio:<8.2f}  {plain:11.3f}  {cached:10.3f}  '
+              f'{plain / cached:9.2f}  {cache.hits / len(packages):9.2%}')
+
+
+if __name__ == '__main__':
+    main()
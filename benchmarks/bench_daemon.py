@@ -0,0 +1,79 @@
+"""Демон на Unix-сокете против отдельного процесса на каждый пакет.
+
+Сравниваются:
+- ``python -m homework --input -`` на каждый пакет (как сейчас);
+- ``python -m homework --client SOCKET --input -`` на каждый пакет;
+- ``send_packages`` из уже запущенного процесса, блоками.
+
+Запуск: python benchmarks/bench_daemon.py [--packages 200]
+"""
+import argparse
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import BASE_DIR, homework, make_lines
+
+
+def run_per_package(command: list, lines: list, env: dict) -> list:
+    """Задержка на пакет при запуске ``command`` для каждого пакета, мс."""
+    latencies = []
+    for line in lines:
+        start = time.perf_counter()
+        subprocess.run(command, input=line, text=True, cwd=BASE_DIR,
+                       env=env, check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(label: str, latencies: list) -> None:
+    total = sum(latencies) / 1000
+    print(f'{label:<28} {len(latencies) / total:9.0f} пакетов/с  '
+          f'p50 {statistics.median(latencies):7.2f} мс')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=100000)
+    args = parser.parse_args()
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    lines = make_lines(args.packages)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'homework.sock')
+        daemon = subprocess.Popen(
+            [sys.executable, '-m', 'homework', '--daemon', path],
+            cwd=BASE_DIR, env=env, stderr=subprocess.DEVNULL
+        )
+        try:
+            while not os.path.exists(path):
+                time.sleep(0.01)
+            report('процесс на пакет', run_per_package(
+                [sys.executable, '-m', 'homework', '--input', '-'],
+                lines, env
+            ))
+            report('клиент на пакет', run_per_package(
+                [sys.executable, '-m', 'homework', '--client', path,
+                 '--input', '-'],
+                lines, env
+            ))
+            batch = make_lines(args.batch, duplicate_ratio=0.5)
+            start = time.perf_counter()
+            homework.send_packages(path, batch, io.StringIO())
+            elapsed = time.perf_counter() - start
+            print(f'{"блоки из одного процесса":<28} '
+                  f'{len(batch) / elapsed:9.0f} пакетов/с')
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+
+if __name__ == '__main__':
+    main()
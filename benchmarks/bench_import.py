@@ -0,0 +1,66 @@
+"""Время импорта homework и запуска скалярного пути.
+
+Каждый замер - отдельный процесс ``python -X importtime``; байткод
+компилируется заранее, как при обычной установке. Скрипт завершается
+с кодом 1, если медиана импорта больше ``--target-ms``.
+
+Запуск: python benchmarks/bench_import.py [--runs 20] [--target-ms 5]
+"""
+import argparse
+import compileall
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from common import BASE_DIR
+
+SCALAR_PATH = ('import homework; homework.read_package("RUN", '
+               '[15000, 1, 75]).show_training_info().get_message()')
+
+
+def import_time_us(env: dict) -> int:
+    """Полное время импорта homework по ``-X importtime``, мкс."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import homework'],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    for line in result.stderr.splitlines():
+        if line.rstrip().endswith('| homework'):
+            return int(line.split('|')[1])
+    raise RuntimeError('homework не найден в выводе -X importtime')
+
+
+def wall_ms(code: str, env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=BASE_DIR, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--target-ms', type=float, default=5.0)
+    args = parser.parse_args()
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    compileall.compile_file(str(BASE_DIR / 'homework.py'), quiet=1)
+
+    imports = [import_time_us(env) / 1000 for _ in range(args.runs)]
+    bare = [wall_ms('pass', env) for _ in range(args.runs)]
+    scalar = [wall_ms(SCALAR_PATH, env) for _ in range(args.runs)]
+    median_import = statistics.median(imports)
+    print(f'import homework (-X importtime): {median_import:.2f} мс')
+    print(f'python -c pass:                  {statistics.median(bare):.1f} мс')
+    print(f'скалярный путь целиком:          '
+          f'{statistics.median(scalar):.1f} мс')
+    if median_import > args.target_ms:
+        print(f'Импорт дольше цели {args.target_ms} мс', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
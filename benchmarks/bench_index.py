@@ -0,0 +1,59 @@
+"""Скорость и объём PackageIndex.
+
+Заполняет индекс на ``--capacity`` пакетов и печатает пакетов в
+секунду для новых пакетов (проверка фильтром и запись), повторов
+(чтение сохранённого результата) и обычного расчёта без индекса, а
+также размер файла и долю ложных срабатываний фильтра.
+
+Запуск: python benchmarks/bench_index.py [--capacity N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import homework, make_packages
+
+
+def rate(count: int, start: float) -> float:
+    return count / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--capacity', type=int, default=1000000)
+    parser.add_argument('--packages', type=int, default=200000)
+    args = parser.parse_args()
+    packages = make_packages(args.packages, seed=21)
+    fresh = make_packages(args.packages, seed=22)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'packages.idx')
+        with homework.PackageIndex(path, args.capacity) as index:
+            start = time.perf_counter()
+            for workout_type, data in packages:
+                index.get_or_add(workout_type, data)
+            added = rate(len(packages), start)
+            start = time.perf_counter()
+            for workout_type, data in packages:
+                index.get_or_add(workout_type, data)
+            served = rate(len(packages), start)
+            filtered = index.filtered
+            misses = sum(index.get(workout_type, data) is None
+                         for workout_type, data in fresh)
+            false_positive = 1 - (index.filtered - filtered) / misses
+        size = os.path.getsize(path)
+        used = os.stat(path).st_blocks * 512
+        start = time.perf_counter()
+        for workout_type, data in packages:
+            homework.calculate_info(workout_type, data)
+        plain = rate(len(packages), start)
+    print(f'индекс на {args.capacity} пакетов: файл {size / 2**20:.1f} МиБ, '
+          f'занято на диске {used / 2**20:.1f} МиБ')
+    print(f'новые пакеты         {added:10.0f} пакетов/с')
+    print(f'повторы из индекса   {served:10.0f} пакетов/с')
+    print(f'расчёт без индекса   {plain:10.0f} пакетов/с')
+    print(f'ложные срабатывания фильтра: {false_positive:.2%}')
+
+
+if __name__ == '__main__':
+    main()
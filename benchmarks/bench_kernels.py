@@ -0,0 +1,57 @@
+"""Сравнение fused_kernel с методами классов тренировок.
+
+Для каждого вида тренировки - время на пакет для трёх путей:
+объект и три метода, ``show_training_info`` и ``calculate_info``
+(одно ядро со свёрнутыми константами), плюс сверка результатов.
+
+Запуск: python benchmarks/bench_kernels.py [--packages N]
+"""
+import argparse
+import time
+
+from common import homework, make_packages
+
+
+def per_package(func, packages: list) -> float:
+    start = time.perf_counter()
+    for workout_type, data in packages:
+        func(workout_type, data)
+    return (time.perf_counter() - start) / len(packages) * 1e9
+
+
+def methods(workout_type: str, data: list) -> tuple:
+    training = homework.read_package(workout_type, data)
+    return (training.get_distance(), training.get_mean_speed(),
+            training.get_spent_calories())
+
+
+def show(workout_type: str, data: list) -> object:
+    return homework.read_package(workout_type, data).show_training_info()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=100000)
+    args = parser.parse_args()
+    packages = make_packages(args.packages)
+    print('вид  методы, нс  show_info, нс  ядро, нс  '
+          'calculate_info, нс  ускорение')
+    for workout_type, training_class in homework.TYPES_OF_TRAINING.items():
+        subset = [package for package in packages
+                  if package[0] == workout_type]
+        kernel = homework.fused_kernel(training_class)
+        for _, data in subset:
+            assert kernel(*data) == methods(workout_type, data)
+        timings = [
+            per_package(methods, subset),
+            per_package(show, subset),
+            per_package(lambda _, data: kernel(*data), subset),
+            per_package(homework.calculate_info, subset),
+        ]
+        print(f'{workout_type:<4} {timings[0]:10.0f}  {timings[1]:13.0f}  '
+              f'{timings[2]:8.0f}  {timings[3]:18.0f}  '
+              f'{timings[1] / timings[3]:9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Память на одну запись: обычные классы, варианты на __slots__ и
+TrainingBatch.
+
+Запуск: python benchmarks/bench_memory.py [--records N]
+"""
+import argparse
+import gc
+import tracemalloc
+
+from common import homework
+
+PACKAGES = {
+    'RUN': [15000, 1.0, 75.0],
+    'WLK': [9000, 1.0, 75.0, 180.0],
+    'SWM': [720, 1.0, 80.0, 25.0, 40.0],
+}
+
+
+def measure(factory, records: int) -> float:
+    """Байт на запись для объектов, созданных ``factory``."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [factory(i) for i in range(records)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # Список ссылок - 8 байт на запись, его не учитываем.
+    size = (after - before) / records - 8
+    del kept
+    return size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=100000)
+    args = parser.parse_args()
+    records = args.records
+
+    print(f'{"вариант":<32} байт/запись')
+    for code, data in PACKAGES.items():
+        regular = homework.TYPES_OF_TRAINING[code]
+        compact = homework.compact_class(regular)
+        for label, cls in ((regular.__name__, regular),
+                           (compact.__qualname__, compact)):
+            size = measure(lambda i: cls(i, *data[1:]), records)
+            print(f'{label:<32} {size:8.1f}')
+
+    message = ('Running', 1.0, 9.75, 9.75, 699.75)
+    for cls in (homework.InfoMessage, homework.CompactInfoMessage):
+        size = measure(lambda i: cls(*message[:-1], float(i)), records)
+        print(f'{cls.__name__:<32} {size:8.1f}')
+
+    batch = homework.TrainingBatch()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(records):
+        batch.append('SWM', [i] + PACKAGES['SWM'][1:])
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{"TrainingBatch":<32} {(after - before) / records:8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Точность и скорость режимов float32 и decimal против float64.
+
+Для каждого вида тренировки печатает наибольшую относительную и
+абсолютную ошибку калорий, дистанции и скорости против float64
+(методы классов) и долю пакетов, у которых отличается напечатанное
+с тремя знаками сообщение. Затем - пакетов в секунду для каждого
+режима.
+
+Запуск: python benchmarks/bench_numeric.py [--packages N]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from common import homework, make_packages
+
+FIELDS = ('distance', 'speed', 'calories')
+
+
+def columns(packages: list) -> dict:
+    result = {name: np.zeros(len(packages))
+              for name in homework.TrainingBatch.COLUMNS}
+    for row, (workout_type, data) in enumerate(packages):
+        names = homework._training_params(
+            homework.TYPES_OF_TRAINING[workout_type])
+        for name, value in zip(names, data):
+            result[name][row] = value
+    result['height'][result['height'] == 0] = 1
+    return result
+
+
+def errors(exact: np.ndarray, approx: np.ndarray) -> tuple:
+    absolute = np.abs(approx.astype(np.float64) - exact)
+    scale = np.maximum(np.abs(exact), 1.0)
+    return float(absolute.max()), float((absolute / scale).max())
+
+
+def text(values: np.ndarray) -> list:
+    return [f'{value:.3f}' for value in values.tolist()]
+
+
+def accuracy(packages: list) -> None:
+    print('вид  режим    поле      абс. ошибка   отн. ошибка  '
+          'другой текст')
+    for workout_type in homework.TYPES_OF_TRAINING:
+        subset = [package for package in packages
+                  if package[0] == workout_type]
+        exact = {name: np.array([getattr(
+            homework.calculate_info(*package), name)
+            for package in subset]) for name in FIELDS}
+        codes = [workout_type] * len(subset)
+        result32 = homework.calculate_batch(codes, **columns(subset),
+                                            dtype='float32')
+        decimal = {name: np.array([float(getattr(
+            homework.calculate_info(*package, 'decimal'), name))
+            for package in subset]) for name in FIELDS}
+        for mode, result in (('float32', result32), ('decimal', decimal)):
+            for name in FIELDS:
+                absolute, relative = errors(exact[name], result[name])
+                changed = np.mean([a != b for a, b in zip(
+                    text(exact[name]), text(result[name]))])
+                print(f'{workout_type:<4} {mode:<8} {name:<9} '
+                      f'{absolute:11.3e}   {relative:11.3e}  '
+                      f'{changed:11.3%}')
+
+
+def per_second(func, count: int) -> float:
+    start = time.perf_counter()
+    func()
+    return count / (time.perf_counter() - start)
+
+
+def throughput(packages: list) -> None:
+    codes = np.array([package[0] for package in packages])
+    data = columns(packages)
+    data32 = {name: column.astype(np.float32)
+              for name, column in data.items()}
+    scalar = packages[:100000]
+    rates = {
+        'calculate_batch float64': per_second(
+            lambda: homework.calculate_batch(codes, **data), len(codes)),
+        'calculate_batch float32': per_second(
+            lambda: homework.calculate_batch(codes, **data32,
+                                             dtype='float32'), len(codes)),
+        'calculate_info float64': per_second(
+            lambda: [homework.calculate_info(*package)
+                     for package in scalar], len(scalar)),
+        'calculate_info decimal': per_second(
+            lambda: [homework.calculate_info(*package, 'decimal')
+                     for package in scalar], len(scalar)),
+    }
+    print()
+    for name, rate in rates.items():
+        print(f'{name:<24} {rate:14.0f} пакетов/с')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=1000000)
+    parser.add_argument('--accuracy-packages', type=int, default=200000)
+    args = parser.parse_args()
+    accuracy(make_packages(args.accuracy_packages, seed=20))
+    throughput(make_packages(args.packages, seed=21))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""Кривая масштабирования process_stream_parallel по числу процессов.
+
+Запуск: python benchmarks/bench_parallel.py [--packages N] [--max-workers K]
+"""
+import argparse
+import io
+import os
+import time
+
+from common import homework, make_lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=500000)
+    parser.add_argument('--max-workers', type=int,
+                        default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    lines = make_lines(args.packages)
+
+    start = time.perf_counter()
+    homework.process_stream(homework.iter_packages(lines), io.StringIO())
+    serial = time.perf_counter() - start
+    print('workers  seconds  packages/s  speedup')
+    print(f'serial   {serial:7.3f}  {args.packages / serial:10.0f}  1.00')
+    for workers in range(1, args.max_workers + 1):
+        start = time.perf_counter()
+        homework.process_stream_parallel(lines, io.StringIO(), workers)
+        elapsed = time.perf_counter() - start
+        print(f'{workers:<7}  {elapsed:7.3f}  '
+              f'{args.packages / elapsed:10.0f}  {serial / elapsed:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Сравнение скорости вывода InfoMessage.
+
+Старый способ (``OUTPUT_TEXT.format(**asdict(self))``), текущий
+``get_message`` и пакетный ``render_messages``.
+
+Запуск: python benchmarks/bench_render.py [--messages N]
+"""
+import argparse
+import io
+import time
+from dataclasses import asdict
+
+from common import homework
+
+
+def run(label: str, func, count: int) -> str:
+    start = time.perf_counter()
+    output = func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<22} {elapsed:7.3f} с  {count / elapsed:10.0f} сообщ./с')
+    return output
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=300000)
+    args = parser.parse_args()
+    messages = [homework.InfoMessage('Running', 1.0 + i % 7, 9.75, 9.75,
+                                     699.75 + i)
+                for i in range(args.messages)]
+
+    def with_asdict() -> str:
+        output = io.StringIO()
+        for message in messages:
+            output.write(message.OUTPUT_TEXT.format(**asdict(message)))
+            output.write('\n')
+        return output.getvalue()
+
+    def with_get_message() -> str:
+        output = io.StringIO()
+        for message in messages:
+            output.write(message.get_message())
+            output.write('\n')
+        return output.getvalue()
+
+    def with_render() -> str:
+        output = io.StringIO()
+        homework.render_messages(messages, output)
+        return output.getvalue()
+
+    baseline = run('asdict + format', with_asdict, args.messages)
+    assert run('get_message', with_get_message, args.messages) == baseline
+    assert run('render_messages', with_render, args.messages) == baseline
+
+
+if __name__ == '__main__':
+    main()
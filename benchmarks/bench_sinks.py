@@ -0,0 +1,66 @@
+"""Записей в секунду для приёмников результатов и цикла с print.
+
+Сообщения считаются заранее, замеряется только запись в файлы во
+временном каталоге.
+
+Запуск: python benchmarks/bench_sinks.py [--packages N]
+"""
+import argparse
+import contextlib
+import tempfile
+import time
+from pathlib import Path
+
+from common import homework, make_packages
+
+
+def print_loop(messages: list, path: Path, batch_size: int) -> None:
+    with open(path, 'w', encoding='utf-8') as output:
+        with contextlib.redirect_stdout(output):
+            for info in messages:
+                print(info.get_message())
+
+
+def sink_writer(name: str):
+    def write(messages: list, path: Path, batch_size: int) -> None:
+        with homework.open_sink(str(path), batch_size=batch_size) as sink:
+            sink.write_many(messages)
+    write.__name__ = name
+    return write
+
+
+CASES = [
+    ('print', 'results.txt', print_loop),
+    ('text', 'results.txt', sink_writer('text')),
+    ('csv', 'results.csv', sink_writer('csv')),
+    ('jsonl', 'results.jsonl', sink_writer('jsonl')),
+    ('sqlite', 'results.db', sink_writer('sqlite')),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=200000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+',
+                        default=[1, 100, 10000])
+    args = parser.parse_args()
+    messages = [homework.calculate_info(workout_type, data)
+                for workout_type, data in make_packages(args.packages)]
+    print('приёмник  блок    записей/с')
+    with tempfile.TemporaryDirectory() as directory:
+        for name, filename, write in CASES:
+            sizes = [1] if name == 'print' else args.batch_sizes
+            for batch_size in sizes:
+                path = Path(directory) / filename
+                path.unlink(missing_ok=True)
+                count = len(messages)
+                if name == 'sqlite' and batch_size == 1:
+                    count = min(count, 2000)
+                start = time.perf_counter()
+                write(messages[:count], path, batch_size)
+                rate = count / (time.perf_counter() - start)
+                print(f'{name:<9} {batch_size:<6} {rate:10.0f}')
+
+
+if __name__ == '__main__':
+    main()
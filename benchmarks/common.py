@@ -0,0 +1,43 @@
+"""Общие помощники скриптов замеров.
+
+Скрипты импортируют ``homework`` отсюда: модуль добавляет корень
+репозитория в ``sys.path``.
+"""
+import importlib
+import json
+import random
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve(strict=True).parent.parent
+if str(BASE_DIR) not in sys.path:
+    sys.path.append(str(BASE_DIR))
+
+homework = importlib.import_module('homework')
+
+
+def make_packages(count: int, duplicate_ratio: float = 0.0,
+                  seed: int = 0) -> list:
+    """Сгенерировать пакеты, доля ``duplicate_ratio`` из них - повторы."""
+    rnd = random.Random(seed)
+    packages: list = []
+    for _ in range(count):
+        if packages and rnd.random() < duplicate_ratio:
+            packages.append(rnd.choice(packages))
+            continue
+        workout_type = rnd.choice(['RUN', 'WLK', 'SWM'])
+        data = [rnd.randint(500, 30000), rnd.uniform(0.2, 3),
+                rnd.uniform(40, 120)]
+        if workout_type == 'WLK':
+            data.append(rnd.uniform(150, 200))
+        elif workout_type == 'SWM':
+            data += [rnd.choice([25, 50]), rnd.randint(10, 80)]
+        packages.append((workout_type, data))
+    return packages
+
+
+def make_lines(count: int, duplicate_ratio: float = 0.0,
+               seed: int = 0) -> list:
+    """Те же пакеты строками JSON."""
+    return [json.dumps(package) + '\n'
+            for package in make_packages(count, duplicate_ratio, seed)]
@@ -0,0 +1,70 @@
+"""Нагрузочный тест TCP-сервера homework.
+
+По умолчанию поднимает сервер в этом же процессе; с ``--port``
+подключается к уже запущенному (``python -m homework --serve``).
+Каждое соединение шлёт пакеты по одному и ждёт ответа, поэтому
+задержка - полный круг запрос-ответ.
+
+Запуск: python benchmarks/load_server.py [--connections 1000]
+        [--requests 20] [--port PORT]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from common import homework
+
+PACKAGES = [
+    b'["SWM", [720, 1, 80, 25, 40]]\n',
+    b'["RUN", [15000, 1, 75]]\n',
+    b'["WLK", [9000, 1, 75, 180]]\n',
+]
+
+
+async def client(host: str, port: int, requests: int,
+                 latencies: list) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    for i in range(requests):
+        start = time.perf_counter()
+        writer.write(PACKAGES[i % len(PACKAGES)])
+        await reader.readline()
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run(args: argparse.Namespace) -> None:
+    server = None
+    port = args.port
+    if port is None:
+        server = await homework.start_server(args.host, 0, args.format)
+        port = server.sockets[0].getsockname()[1]
+    latencies: list = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(args.host, port, args.requests, latencies)
+                           for _ in range(args.connections)))
+    elapsed = time.perf_counter() - start
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'соединений: {args.connections}, запросов: {len(latencies)}')
+    print(f'запросов/с: {len(latencies) / elapsed:.0f}')
+    print(f'p50: {quantiles[49] * 1000:.2f} мс, '
+          f'p99: {quantiles[98] * 1000:.2f} мс')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--format', choices=['text', 'json'],
+                        default='text')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Набор замеров горячих путей homework.py.
+
+Печатает результаты в JSON (наносекунды на операцию), сравнивает их
+с сохранённым базовым файлом и завершается с кодом 1, если какой-то
+замер стал медленнее больше чем на ``--threshold``.
+
+Запуск:
+    python benchmarks/run.py                      # замер и сравнение
+    python benchmarks/run.py --save-baseline      # обновить baseline.json
+    python benchmarks/run.py --output result.json --threshold 0.2
+"""
+import argparse
+import io
+import json
+import platform
+import sys
+import timeit
+from pathlib import Path
+from typing import Callable, Dict
+
+from common import homework, make_lines
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+END_TO_END_PACKAGES = 10000
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    """Лучшее время одного вызова ``func`` в наносекундах."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number * 1e9
+
+
+def cases() -> Dict[str, Callable[[], object]]:
+    """Замеряемые операции по именам."""
+    result: Dict[str, Callable[[], object]] = {}
+    for workout_type, data in homework.DEMO_PACKAGES:
+        training = homework.read_package(workout_type, data)
+        name = type(training).__name__
+        result[f'read_package[{workout_type}]'] = (
+            lambda workout_type=workout_type, data=data:
+            homework.read_package(workout_type, data)
+        )
+        result[f'get_spent_calories[{name}]'] = training.get_spent_calories
+        result[f'show_training_info[{name}]'] = training.show_training_info
+        result[f'calculate_info[{workout_type}]'] = (
+            lambda workout_type=workout_type, data=data:
+            homework.calculate_info(workout_type, data)
+        )
+    message = homework.read_package(
+        *homework.DEMO_PACKAGES[0]).show_training_info()
+    result['InfoMessage.get_message'] = message.get_message
+    lines = make_lines(END_TO_END_PACKAGES)
+    result[f'end_to_end[{END_TO_END_PACKAGES}]'] = (
+        lambda: homework.process_stream(homework.iter_packages(lines),
+                                        io.StringIO())
+    )
+    return result
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float],
+            threshold: float) -> list:
+    """Список замеров, ставших медленнее больше чем на ``threshold``."""
+    regressions = []
+    for name, value in results.items():
+        old = baseline.get(name)
+        if old and (value - old) / old > threshold:
+            regressions.append((name, old, value))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='записать результаты в файл базовой линии')
+    parser.add_argument('--output', type=Path,
+                        help='куда записать JSON (по умолчанию stdout)')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='допустимое замедление, доля (0.2 = 20%%)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = {name: round(measure(func, args.repeat), 1)
+               for name, func in cases().items()}
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'unit': 'ns/op',
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False) + '\n'
+    if args.output:
+        args.output.write_text(text, encoding='utf-8')
+    else:
+        sys.stdout.write(text)
+
+    if args.save_baseline:
+        args.baseline.write_text(text, encoding='utf-8')
+        return 0
+    if not args.baseline.exists():
+        print(f'Нет базовой линии {args.baseline}', file=sys.stderr)
+        return 0
+    baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+    regressions = compare(results, baseline['results'], args.threshold)
+    for name, old, new in regressions:
+        print(f'РЕГРЕССИЯ {name}: {old:.1f} -> {new:.1f} нс '
+              f'(+{(new - old) / old:.0%})', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,396 @@
+"""Синтетическая нагрузка для homework: генератор пакетов и повтор.
+
+``generate`` пишет воспроизводимый по ``--seed`` поток пакетов JSON
+любого размера в формате ``read_package``/``parse_package``: доли видов
+тренировок, повторов и испорченных строк и распределения значений
+задаются ключами. ``replay`` прогоняет такой поток через трекер (в этом
+же процессе или через сервер ``--serve``/``--daemon``) с заданной
+частотой и печатает пропускную способность и гистограмму задержек.
+
+Запуск:
+    python benchmarks/workload.py generate --count 1000000 --seed 1 \\
+        --mix RUN=0.5,WLK=0.3,SWM=0.2 --duplicates 0.1 --malformed 0.01 \\
+        --value duration=lognormal:0:0.5 --output packages.jsonl
+    python benchmarks/workload.py replay --input packages.jsonl \\
+        --rate 20000 --report report.json
+    python benchmarks/workload.py replay --input packages.jsonl \\
+        --connect 127.0.0.1:8765
+"""
+import argparse
+import json
+import math
+import random
+import socket
+import sys
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common import homework
+
+DEFAULT_MIX = {'RUN': 0.4, 'WLK': 0.3, 'SWM': 0.3}
+# Распределения полей: (вид, параметры). Значения меньше нижней границы
+# FIELD_LIMITS генерируются заново, целые поля округляются.
+DEFAULT_VALUES: Dict[str, Tuple[str, Tuple[float, ...]]] = {
+    'action': ('uniform', (500, 30000)),
+    'duration': ('uniform', (0.2, 3)),
+    'weight': ('normal', (75, 12)),
+    'height': ('normal', (175, 10)),
+    'length_pool': ('choice', (25, 50)),
+    'count_pool': ('uniform', (10, 80)),
+}
+INTEGER_FIELDS = ('action', 'count_pool')
+# Повторы берутся из последних DUPLICATE_POOL пакетов, так память
+# генератора не зависит от длины потока.
+DUPLICATE_POOL = 10000
+# Попыток получить значение выше границы FIELD_LIMITS: распределение,
+# которое почти никогда её не превышает, - ошибка в ключах, а не повод
+# крутиться бесконечно.
+VALUE_ATTEMPTS = 1000
+MALFORMED_KINDS = ('bad_json', 'unknown_type', 'bad_arity', 'not_numeric',
+                   'out_of_range')
+FORMATS = ('list', 'object')
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """``RUN=0.5,WLK=0.5`` -> доли видов тренировок."""
+    mix = {}
+    for part in text.split(','):
+        code, weight = part.split('=')
+        mix[code] = float(weight)
+    return mix
+
+
+def parse_value(text: str) -> Tuple[str, Tuple[str, Tuple[float, ...]]]:
+    """``duration=lognormal:0:0.5`` -> поле и распределение.
+
+    Распределение сразу проверяется пробной выборкой: если оно не даёт
+    значений выше границы поля, ошибка видна при разборе ключей.
+    """
+    name, spec = text.split('=')
+    kind, *params = spec.split(':')
+    if kind not in ('uniform', 'normal', 'lognormal', 'choice'):
+        raise argparse.ArgumentTypeError(f'неизвестное распределение {kind}')
+    distribution = (kind, tuple(map(float, params)))
+    try:
+        value = draw(random.Random(0), name, distribution)
+    except (TypeError, ValueError, IndexError) as exc:
+        raise argparse.ArgumentTypeError(f'{text}: {exc}')
+    if value is None:
+        raise argparse.ArgumentTypeError(
+            f'{text}: за {VALUE_ATTEMPTS} попыток нет значений выше '
+            f'границы поля {name}'
+        )
+    return name, distribution
+
+
+def draw(rng: random.Random, name: str,
+         distribution: Tuple[str, Tuple[float, ...]]) -> Optional[float]:
+    """Значение поля выше его границы FIELD_LIMITS или ``None``.
+
+    Значения ниже границы генерируются заново, не больше
+    ``VALUE_ATTEMPTS`` раз.
+    """
+    kind, params = distribution
+    limit, strict = homework.FIELD_LIMITS.get(name, (0, False))
+    for _ in range(VALUE_ATTEMPTS):
+        if kind == 'choice':
+            value = rng.choice(params)
+        elif kind == 'normal':
+            value = rng.gauss(*params)
+        elif kind == 'lognormal':
+            value = rng.lognormvariate(*params)
+        else:
+            value = rng.uniform(*params)
+        if name in INTEGER_FIELDS:
+            value = int(round(value))
+        if value > limit or (value == limit and not strict):
+            return value
+    return None
+
+
+class PackageGenerator:
+    """Бесконечный воспроизводимый поток строк-пакетов JSON.
+
+    Каждая строка с вероятностью ``malformed_ratio`` испорчена одним
+    из способов ``MALFORMED_KINDS``, иначе с вероятностью
+    ``duplicate_ratio`` повторяет один из недавних пакетов, иначе - новый
+    пакет вида из ``mix`` со значениями из ``values``.
+    """
+
+    def __init__(self, seed: int = 0,
+                 mix: Optional[Dict[str, float]] = None,
+                 duplicate_ratio: float = 0.0,
+                 malformed_ratio: float = 0.0,
+                 values: Optional[Dict[str, Tuple[str, tuple]]] = None,
+                 package_format: str = 'list') -> None:
+        mix = mix or DEFAULT_MIX
+        unknown = set(mix) - set(homework.TYPES_OF_TRAINING)
+        if unknown:
+            raise ValueError(f'Неизвестные виды тренировок: {unknown}')
+        if package_format not in FORMATS:
+            raise ValueError(f'Неизвестный формат {package_format}')
+        self.random = random.Random(seed)
+        self.codes = list(mix)
+        self.weights = [mix[code] for code in self.codes]
+        self.duplicate_ratio = duplicate_ratio
+        self.malformed_ratio = malformed_ratio
+        self.values = {**DEFAULT_VALUES, **(values or {})}
+        self.package_format = package_format
+        self.recent: deque = deque(maxlen=DUPLICATE_POOL)
+
+    def _value(self, name: str) -> float:
+        value = draw(self.random, name, self.values[name])
+        if value is None:
+            raise ValueError(f'Распределение {self.values[name]} поля '
+                             f'{name} не даёт значений выше границы')
+        return value
+
+    def package(self) -> Tuple[str, list]:
+        """Новый корректный пакет."""
+        code = self.random.choices(self.codes, self.weights)[0]
+        training_class = homework.TYPES_OF_TRAINING[code]
+        return code, [self._value(name)
+                      for name in homework._training_params(training_class)]
+
+    def _encode(self, workout_type: object, data: object) -> str:
+        if self.package_format == 'object':
+            return json.dumps({'workout_type': workout_type, 'data': data})
+        return json.dumps([workout_type, data])
+
+    def _malformed(self) -> str:
+        kind = self.random.choice(MALFORMED_KINDS)
+        workout_type, data = self.package()
+        if kind == 'bad_json':
+            return self._encode(workout_type, data)[:-3]
+        if kind == 'unknown_type':
+            return self._encode('XXX', data)
+        if kind == 'bad_arity':
+            return self._encode(workout_type, data[:-1])
+        if kind == 'not_numeric':
+            data[0] = 'много'
+        else:
+            data[1] = -data[1]
+        return self._encode(workout_type, data)
+
+    def line(self) -> str:
+        """Следующая строка потока без перевода строки."""
+        roll = self.random.random()
+        if roll < self.malformed_ratio:
+            return self._malformed()
+        if self.recent and roll < self.malformed_ratio + self.duplicate_ratio:
+            return self.random.choice(self.recent)
+        line = self._encode(*self.package())
+        self.recent.append(line)
+        return line
+
+    def lines(self, count: Optional[int] = None) -> Iterator[str]:
+        """``count`` строк с переводом строки, без ``count`` - бесконечно."""
+        produced = 0
+        while count is None or produced < count:
+            yield self.line() + '\n'
+            produced += 1
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с корзинами по степеням двойки (мкс).
+
+    Память не зависит от числа замеров, квантили точны до корзины.
+    """
+
+    def __init__(self) -> None:
+        self.buckets: List[int] = [0] * 40
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds: float) -> None:
+        microseconds = seconds * 1e6
+        index = 0 if microseconds < 1 else min(
+            len(self.buckets) - 1, int(math.log2(microseconds)) + 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    @staticmethod
+    def upper_bound(index: int) -> float:
+        """Верхняя граница корзины в секундах."""
+        return 2 ** index / 1e6
+
+    def quantile(self, share: float) -> float:
+        """Верхняя граница корзины, куда попадает квантиль ``share``."""
+        rank = share * self.count
+        seen = 0
+        for index, amount in enumerate(self.buckets):
+            seen += amount
+            if amount and seen >= rank:
+                return min(self.upper_bound(index), self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            'count': self.count,
+            'mean_seconds': self.total / self.count if self.count else 0.0,
+            'max_seconds': self.maximum,
+            'quantiles_seconds': {str(share): self.quantile(share)
+                                  for share in (0.5, 0.9, 0.99, 0.999)},
+            'buckets': [{'le_seconds': self.upper_bound(index),
+                         'count': amount}
+                        for index, amount in enumerate(self.buckets)
+                        if amount],
+        }
+
+
+def local_target() -> Callable[[str], bool]:
+    """Обработка строки в этом процессе; ``False`` - пакет отклонён.
+
+    Как обычный путь CLI без ``--rejects``: строки с отрицательными
+    значениями считаются, отклоняются только неразборные.
+    """
+    def process(line: str) -> bool:
+        try:
+            workout_type, data = homework.parse_package(line)
+            homework.calculate_info(workout_type, data).get_message()
+        except (homework.UnknownWorkoutType, ValueError, KeyError,
+                TypeError, ArithmeticError):
+            return False
+        return True
+    return process
+
+
+ERROR_PREFIXES = (b'{"error"', 'Ошибка'.encode('utf-8'))
+
+
+def server_target(address: str) -> Callable[[str], bool]:
+    """Запрос к серверу ``--serve`` (``HOST:PORT``) или ``--daemon``
+    (путь к сокету); ``False`` - ответ с ошибкой.
+    """
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        connection = socket.create_connection((host, int(port)))
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    else:
+        connection = socket.socket(socket.AF_UNIX)
+        connection.connect(address)
+    reader = connection.makefile('rb')
+
+    def process(line: str) -> bool:
+        connection.sendall(line.encode('utf-8'))
+        return not reader.readline().startswith(ERROR_PREFIXES)
+    return process
+
+
+def replay(lines: Iterable[str], process: Callable[[str], bool],
+           rate: float = 0.0) -> Dict[str, object]:
+    """Прогнать строки через ``process`` с частотой ``rate`` в секунду.
+
+    Нагрузка открытая: строка i назначается на момент ``i / rate`` от
+    начала. Если трекер не успевает, задержка считается от назначенного
+    момента, то есть с ожиданием в очереди, а не только время
+    обработки. ``rate=0`` - без ограничения частоты.
+    """
+    histogram = LatencyHistogram()
+    errors = 0
+    start = time.perf_counter()
+    interval = 1 / rate if rate else 0.0
+    for number, line in enumerate(lines):
+        scheduled = start + number * interval
+        now = time.perf_counter()
+        if not rate:
+            scheduled = now
+        elif now < scheduled:
+            if scheduled - now > 0.002:
+                time.sleep(scheduled - now - 0.002)
+            while time.perf_counter() < scheduled:
+                pass
+            # Трекер не отстаёт, очереди нет: задержка считается от
+            # фактической отправки, без погрешности ожидания.
+            scheduled = time.perf_counter()
+        if not process(line):
+            errors += 1
+        histogram.record(time.perf_counter() - scheduled)
+    elapsed = time.perf_counter() - start
+    return {
+        'target_rate': rate,
+        'packages': histogram.count,
+        'errors': errors,
+        'seconds': elapsed,
+        'throughput': histogram.count / elapsed if elapsed else 0.0,
+        'latency': histogram.to_dict(),
+    }
+
+
+def print_report(report: Dict[str, object]) -> None:
+    latency = report['latency']
+    print(f"пакетов: {report['packages']}, отклонено: {report['errors']}, "
+          f"{report['throughput']:.0f} пакетов/с "
+          f"(цель {report['target_rate'] or 'без ограничения'})")
+    quantiles = ', '.join(f'p{float(share) * 100:g} {value * 1e6:.0f} мкс'
+                          for share, value
+                          in latency['quantiles_seconds'].items())
+    print(f'задержка: {quantiles}, max {latency["max_seconds"] * 1e6:.0f} мкс')
+    width = max(bucket['count'] for bucket in latency['buckets'])
+    for bucket in latency['buckets']:
+        bar = '#' * max(1, round(40 * bucket['count'] / width))
+        print(f"<= {bucket['le_seconds'] * 1e6:>10.0f} мкс "
+              f"{bucket['count']:>9} {bar}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate = commands.add_parser('generate', help='записать поток')
+    generate.add_argument('--count', type=int, required=True)
+    generate.add_argument('--output', default='-')
+    replay_parser = commands.add_parser('replay', help='прогнать поток')
+    replay_parser.add_argument('--input',
+                               help='файл пакетов; без него - генератор')
+    replay_parser.add_argument('--count', type=int, default=100000,
+                               help='пакетов из генератора без --input')
+    replay_parser.add_argument('--rate', type=float, default=0.0,
+                               help='пакетов в секунду, 0 - без ограничения')
+    replay_parser.add_argument('--connect', metavar='HOST:PORT|SOCKET',
+                               help='сервер --serve или --daemon вместо '
+                                    'обработки в этом процессе')
+    replay_parser.add_argument('--report', help='сохранить отчёт в JSON')
+    for command in (generate, replay_parser):
+        command.add_argument('--seed', type=int, default=0)
+        command.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+        command.add_argument('--duplicates', type=float, default=0.0)
+        command.add_argument('--malformed', type=float, default=0.0)
+        command.add_argument('--value', type=parse_value, action='append',
+                             default=[], metavar='FIELD=KIND:P1[:P2]')
+        command.add_argument('--format', choices=FORMATS, default='list')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    generator = PackageGenerator(args.seed, args.mix, args.duplicates,
+                                 args.malformed, dict(args.value),
+                                 args.format)
+    if args.command == 'generate':
+        if args.output == '-':
+            sys.stdout.writelines(generator.lines(args.count))
+            return
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.writelines(generator.lines(args.count))
+        return
+    process = (local_target() if args.connect is None
+               else server_target(args.connect))
+    if args.input:
+        with open(args.input, encoding='utf-8') as lines:
+            report = replay(lines, process, args.rate)
+    else:
+        # Строки готовятся заранее, чтобы генерация не входила в замер.
+        report = replay(list(generator.lines(args.count)), process,
+                        args.rate)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,149 @@
-from dataclasses import dataclass, asdict
-from typing import Any, ClassVar, Dict
+"""Модуль фитнес-трекера.
 
+На пути ``read_package`` -> ``show_training_info`` -> ``get_message``
+модуль импортирует только уже загруженные интерпретатором ``sys``,
+``time`` и ``io``. Всё остальное (``json``, ``argparse``, NumPy,
+``asyncio`` и т.д.) импортируется внутри функций, которым оно нужно.
+"""
+from __future__ import annotations
 
-@dataclass
-class InfoMessage:
-    """Информационное сообщение о тренировке."""
+import io
+import sys
+import time
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import argparse
+    from typing import (Any, BinaryIO, Callable, ClassVar, Deque, Dict,
+                        Iterable, Iterator, List, Optional, Sequence,
+                        TextIO, Tuple)
+
+
+class _Message:
+    """Общие методы сообщений о тренировке."""
+
+    FIELDS: ClassVar[Tuple[str, ...]] = ('training_type', 'duration',
+                                         'distance', 'speed', 'calories')
+    __slots__ = ()
+
+    def __init__(self,
+                 training_type: str,
+                 duration: float,
+                 distance: float,
+                 speed: float,
+                 calories: float) -> None:
+        self.training_type = training_type
+        self.duration = duration
+        self.distance = distance
+        self.speed = speed
+        self.calories = calories
+
+    def _astuple(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.FIELDS)
+
+    def __repr__(self) -> str:
+        values = ', '.join(f'{name}={getattr(self, name)!r}'
+                           for name in self.FIELDS)
+        return f'{type(self).__name__}({values})'
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._astuple() == other._astuple()
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def get_message(self) -> str:
+        template, fields = _compile_template(self.OUTPUT_TEXT)
+        message = template.format(*fields(self))
+        return message
+
+
+class InfoMessage(_Message):
+    """Информационное сообщение о тренировке.
+
+    Обычный класс вместо ``@dataclass``: импорт ``dataclasses`` тянет
+    ``inspect`` и удваивает время импорта модуля.
+    """
 
-    training_type: str
-    duration: float
-    distance: float
-    speed: float
-    calories: float
     OUTPUT_TEXT: ClassVar[str] = 'Тип тренировки: {training_type}; ' + \
                                  'Длительность: {duration:.3f} ч.; ' + \
                                  'Дистанция: {distance:.3f} км; ' + \
                                  'Ср. скорость: {speed:.3f} км/ч; ' + \
                                  'Потрачено ккал: {calories:.3f}.'
 
-    def get_message(self) -> str:
-        message = self.OUTPUT_TEXT.format(**asdict(self))
-        return message
+
+_TEMPLATES: Dict[str, Tuple[str, Callable[[Any], tuple]]] = {}
+
+
+def _compile_template(text: str) -> Tuple[str, Callable[[Any], tuple]]:
+    """Превратить шаблон с именованными полями в позиционный.
+
+    Возвращает позиционный шаблон и функцию, достающую значения полей
+    из сообщения одним кортежем, без промежуточного словаря. Результат
+    запоминается для каждого шаблона.
+    """
+    compiled = _TEMPLATES.get(text)
+    if compiled is None:
+        compiled = _TEMPLATES[text] = _parse_template(text)
+    return compiled
+
+
+def _parse_template(text: str) -> Tuple[str, Callable[[Any], tuple]]:
+    # _string.formatter_parser - встроенный разборщик, на котором
+    # построен string.Formatter; сам string тянет за собой re.
+    from _string import formatter_parser
+    from operator import attrgetter
+
+    parts = []
+    names = []
+    for literal, name, spec, conversion in formatter_parser(text):
+        parts.append(literal.replace('{', '{{').replace('}', '}}'))
+        if name is None:
+            continue
+        field = str(len(names))
+        if conversion:
+            field += '!' + conversion
+        if spec:
+            field += ':' + spec
+        parts.append('{' + field + '}')
+        names.append(name)
+    getter = attrgetter(*names)
+    if len(names) == 1:
+        return ''.join(parts), lambda message: (getter(message),)
+    return ''.join(parts), getter
 
 
 class UnknownWorkoutType(Exception):
     '''Класс для неизвестной тренировки'''
-    print(Exception)
+
+
+TYPES_OF_TRAINING: Dict[str, type['Training']] = {}
 
 
 class Training:
-    """Базовый класс тренировки."""
+    """Базовый класс тренировки.
+
+    Наследник с ключом ``code`` регистрируется в ``TYPES_OF_TRAINING``
+    при создании класса, например ``class Cycling(Training, code='CYC')``.
+    """
     LEN_STEP: ClassVar[float] = 0.65
     M_IN_KM: ClassVar[int] = 1000
     MINUTES_IN_HOURS: ClassVar[int] = 60
+    WORKOUT_CODE: ClassVar[Optional[str]] = None
+
+    def __init_subclass__(cls, code: Optional[str] = None,
+                          **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if code is None:
+            return
+        if code in TYPES_OF_TRAINING:
+            raise ValueError(
+                f'Код тренировки {code} уже занят классом '
+                f'{TYPES_OF_TRAINING[code].__name__}'
+            )
+        cls.WORKOUT_CODE = code
+        TYPES_OF_TRAINING[code] = cls
 
     def __init__(self,
                  action: int,
@@ -49,32 +161,68 @@ class Training:
 
     def get_mean_speed(self) -> float:
         """Получить среднюю скорость движения."""
-        mean_speed = self.get_distance() / self.duration
+        return self._mean_speed(self.get_distance())
+
+    def _mean_speed(self, distance: float) -> float:
+        """Средняя скорость при уже посчитанной дистанции ``distance``."""
+        mean_speed = distance / self.duration
         return mean_speed
 
     def get_spent_calories(self) -> float:
         """Получить количество затраченных калорий."""
+        return self._spent_calories(self.get_mean_speed())
+
+    def _spent_calories(self, speed: float) -> float:
+        """Калории при уже посчитанной средней скорости ``speed``."""
         raise NotImplementedError('Определите get_spent_calories')
 
     def show_training_info(self) -> InfoMessage:
         """Вернуть информационное сообщение о выполненной тренировке."""
         training_type = type(self).__name__
+        distance = self.get_distance()
+        speed = _speed_at(self, distance)
         return InfoMessage(training_type,
                            self.duration,
-                           self.get_distance(),
-                           self.get_mean_speed(),
-                           self.get_spent_calories()
+                           distance,
+                           speed,
+                           _calories_at(self, speed)
                            )
 
 
-class Running(Training):
+def _speed_at(training: Any, distance: float) -> float:
+    """Средняя скорость тренировки при уже посчитанной дистанции.
+
+    Как ``_calories_at``: переопределённый ``get_mean_speed`` вызывается
+    сам, иначе дистанция передаётся в ``_mean_speed``.
+    """
+    get_mean_speed = training.get_mean_speed
+    if getattr(get_mean_speed, '__func__',
+               None) is Training.get_mean_speed:
+        return training._mean_speed(distance)
+    return get_mean_speed()
+
+
+def _calories_at(training: Any, speed: float) -> float:
+    """Калории тренировки при уже посчитанной скорости.
+
+    Если ``get_spent_calories`` переопределён (в наследнике или у самого
+    объекта), вызывается он, иначе скорость передаётся в
+    ``_spent_calories`` и второй раз не считается.
+    """
+    get_spent_calories = training.get_spent_calories
+    if getattr(get_spent_calories, '__func__',
+               None) is Training.get_spent_calories:
+        return training._spent_calories(speed)
+    return get_spent_calories()
+
+
+class Running(Training, code='RUN'):
     """Тренировка: бег."""
     COEFF_CALORIE_BURN: ClassVar[int] = 18
     COEFF_CALORIE_RECREATION: ClassVar[int] = 20
 
-    def get_spent_calories(self) -> float:
+    def _spent_calories(self, speed: float) -> float:
         '''Расход калорий для бега.'''
-        speed = self.get_mean_speed()
         spent_calories = ((self.COEFF_CALORIE_BURN * speed
                            - self.COEFF_CALORIE_RECREATION) * self.weight
                           / self.M_IN_KM * self.duration
@@ -83,7 +231,7 @@ class Running(Training):
         return spent_calories
 
 
-class SportsWalking(Training):
+class SportsWalking(Training, code='WLK'):
     """Тренировка: спортивная ходьба."""
     COEFF_SPEED: ClassVar[float] = 0.035
     COEFF_DURATION: ClassVar[float] = 0.029
@@ -96,17 +244,17 @@ class SportsWalking(Training):
         super().__init__(action, duration, weight)
         self.height = height
 
-    def get_spent_calories(self) -> float:
+    def _spent_calories(self, speed: float) -> float:
         '''Расход калорий для спортивной ходьбы.'''
         spent_calories = ((self.COEFF_SPEED * self.weight
-                           + (self.get_mean_speed()**2 // self.height)
+                           + (speed**2 // self.height)
                            * self.COEFF_DURATION * self.weight)
                           * self.duration * self.MINUTES_IN_HOURS
                           )
         return spent_calories
 
 
-class Swimming(Training):
+class Swimming(Training, code='SWM'):
     """Тренировка: плавание."""
     LEN_STEP: ClassVar[float] = 1.38
     COEFF_WATER_RESIST: ClassVar[float] = 1.1
@@ -122,47 +270,2847 @@ class Swimming(Training):
         self.length_pool = length_pool
         self.count_pool = count_pool
 
-    def get_spent_calories(self) -> float:
+    def _spent_calories(self, speed: float) -> float:
         '''Расчёт израсходованных калорий при плавании.'''
-        spent_calories = ((self.get_mean_speed() + self.COEFF_WATER_RESIST)
+        spent_calories = ((speed + self.COEFF_WATER_RESIST)
                           * self.COEFF_ACTIVITY * self.weight
                           )
         return spent_calories
 
-    def get_mean_speed(self) -> float:
-        '''Расчёт средней скорости при плавании.'''
+    def _mean_speed(self, distance: float) -> float:
+        '''Расчёт средней скорости при плавании (по длине бассейна).'''
         mean_speed = (self.length_pool * self.count_pool
                       / self.M_IN_KM / self.duration
                       )
         return mean_speed
 
 
+_PARAMS: Dict[type, Tuple[str, ...]] = {}
+
+
+def _training_params(training_class: type[Training]) -> Tuple[str, ...]:
+    """Имена параметров конструктора тренировки в порядке пакета."""
+    params = _PARAMS.get(training_class)
+    if params is None:
+        import inspect
+
+        params = _PARAMS[training_class] = tuple(
+            inspect.signature(training_class).parameters
+        )
+    return params
+
+
 def read_package(workout_type: str, data: list) -> Training:
     """Прочитать данные полученные от датчиков."""
-    types_of_trainig: Dict[str, type[Training]] = {
-        'SWM': Swimming,
-        'RUN': Running,
-        'WLK': SportsWalking
-    }
-    if workout_type not in types_of_trainig.keys():
+    training_class = TYPES_OF_TRAINING.get(workout_type)
+    if training_class is None:
         raise UnknownWorkoutType('Неизвестный тип тренировки')
-    choose_training = types_of_trainig[workout_type](*data)
+    choose_training = training_class(*data)
     return choose_training
 
 
-def main(training: Training) -> None:
-    """Главная функция."""
+if TYPE_CHECKING:
+    _Kernel = Callable[..., Tuple[float, float, float]]
+
+_KERNELS: Dict[type, Optional[Tuple[_Kernel, int]]] = {}
+_DECIMAL_KERNELS: Dict[type, Optional[Tuple[_Kernel, int]]] = {}
+# float64 - как у методов классов; float32 - только для массивов
+# (calculate_batch); decimal - точная десятичная арифметика для сверок.
+NUMERIC_MODES = ('float64', 'float32', 'decimal')
+# Значащих цифр в режиме decimal (как у decimal128).
+AUDIT_PRECISION = 34
+# Методы, из которых собирается ядро: имя результата в ядре, метод без
+# аргументов, вызов которого в формулах заменяется результатом, метод с
+# формулой и имена в ядре для его аргументов после self.
+_KERNEL_METHODS = (
+    ('distance', 'get_distance', 'get_distance', ()),
+    ('speed', 'get_mean_speed', '_mean_speed', ('distance',)),
+    ('calories', 'get_spent_calories', '_spent_calories', ('speed',)),
+)
+
+
+def fused_kernel(training_class: type[Training]) -> Optional[_Kernel]:
+    """Функция ``(*data) -> (distance, speed, calories)`` для класса.
+
+    Ядро собирается при первом запросе из исходного кода методов
+    ``get_distance``, ``_mean_speed`` и ``_spent_calories``: три
+    формулы в одной функции, константы класса (с учётом переопределённых
+    в наследниках, как ``Swimming.LEN_STEP``) подставлены как литералы,
+    поэтому нет поиска атрибутов по MRO и повторного расчёта скорости.
+    Порядок операций не меняется, результат совпадает с методами до
+    бита. ``None`` - если метод не сводится к одной формуле, исходный
+    код недоступен, ``__init__`` преобразует аргументы или
+    переопределён ``get_mean_speed``, ``get_spent_calories`` либо
+    ``show_training_info``; тогда нужно считать через методы.
+    """
+    entry = _kernel_entry(training_class)
+    return None if entry is None else entry[0]
+
+
+def _kernel_entry(training_class: type[Training]
+                  ) -> Optional[Tuple[_Kernel, int]]:
+    if training_class not in _KERNELS:
+        _KERNELS[training_class] = _build_kernel(training_class)
+    return _KERNELS[training_class]
+
+
+def _defined_in(training_class: type, name: str) -> type:
+    for klass in training_class.__mro__:
+        if name in vars(klass):
+            return klass
+    return object
+
+
+def _build_kernel(training_class: type[Training],
+                  constant: Optional[Callable[[Any], Any]] = None
+                  ) -> Optional[Tuple[_Kernel, int]]:
+    """Собрать ядро; ``constant`` - преобразование значений констант.
+
+    Без ``constant`` константы встраиваются литералами. С ним - имена
+    констант остаются и берутся из пространства имён ядра, куда
+    кладутся преобразованные значения (``Decimal`` не бывает
+    литералом).
+    """
+    import ast
+
+    # Своё show_training_info может менять сообщение (имя вида,
+    # округление), свои get_mean_speed и get_spent_calories - считать
+    # не через _mean_speed и _spent_calories; ядро их не повторит.
+    if any(_defined_in(training_class, name) is not Training
+           for name in ('show_training_info', 'get_mean_speed',
+                        'get_spent_calories')):
+        return None
+    if not _plain_init(training_class):
+        return None
+    params = _training_params(training_class)
+    tree = ast.parse(f'def kernel({", ".join(params)}):\n'
+                     '    distance = speed = calories = None\n'
+                     '    return distance, speed, calories\n')
+    body = tree.body[0].body
+    namespace: Dict[str, Any] = {}
+    results: Dict[str, str] = {}
+    statements = []
+    for result, method_name, formula_name, arguments in _KERNEL_METHODS:
+        formula = _method_formula(training_class, formula_name, arguments,
+                                  results, constant, namespace)
+        if formula is None:
+            return None
+        statements.append(ast.Assign(
+            targets=[ast.Name(result, ast.Store())], value=formula
+        ))
+        results[method_name] = result
+    body[:1] = statements
+    tree = ast.fix_missing_locations(tree)
+    exec(compile(tree, f'<fused {training_class.__name__}>', 'exec'),
+         namespace)
+    return namespace['kernel'], params.index('duration')
+
+
+def _method_formula(training_class: type[Training], method_name: str,
+                    arguments: Tuple[str, ...], results: Dict[str, str],
+                    constant: Optional[Callable[[Any], Any]],
+                    namespace: Dict[str, Any]) -> Any:
+    """Свернуть тело метода в одно выражение ``ast`` для ядра.
+
+    Метод должен состоять из присваиваний локальным переменным и
+    ``return``; в выражениях допустимы арифметика, числа, аргументы,
+    ``self.<параметр или числовая константа>`` и вызовы уже собранных
+    методов без аргументов (``results``: метод -> имя в ядре). Иначе -
+    ``None``.
+    """
+    import ast
+
+    definition = _method_definition(getattr(training_class, method_name))
+    if (definition is None
+            or len(definition.args.args) != len(arguments) + 1):
+        return None
+    body = definition.body
+    if _is_docstring(body[0]):
+        body = body[1:]
+    inliner = _formula_inliner(training_class, definition.args.args[0].arg,
+                               results, constant, namespace)
+    for name, argument in zip(arguments, definition.args.args[1:]):
+        inliner.names[argument.arg] = ast.Name(name, ast.Load())
+    try:
+        for statement in body[:-1]:
+            if not (isinstance(statement, ast.Assign)
+                    and len(statement.targets) == 1
+                    and isinstance(statement.targets[0], ast.Name)):
+                return None
+            inliner.names[statement.targets[0].id] = inliner.visit(
+                statement.value
+            )
+        if not body or not isinstance(body[-1], ast.Return):
+            return None
+        return inliner.visit(body[-1].value)
+    except ValueError:
+        return None
+
+
+def _method_definition(method: Any) -> Any:
+    """``ast.FunctionDef`` метода или ``None``, если кода нет."""
+    import ast
+    import inspect
+    import textwrap
+
+    try:
+        source = textwrap.dedent(inspect.getsource(method))
+    except (OSError, TypeError):
+        return None
+    definition = ast.parse(source).body[0]
+    if (not isinstance(definition, ast.FunctionDef)
+            or definition.decorator_list):
+        return None
+    return definition
+
+
+def _plain_init(training_class: type[Training]) -> bool:
+    """Конструкторы класса только раскладывают аргументы по атрибутам.
+
+    Ядро подставляет вместо ``self.<параметр>`` сам аргумент пакета.
+    Если ``__init__`` его преобразует (минуты в часы, сумма весов) или
+    передаёт родителю в другом порядке, ядро разошлось бы с методами.
+    Допустимы только ``super().__init__(<параметры родителя>)`` и
+    ``self.p = p``.
+    """
+    owners = [klass for klass in training_class.__mro__
+              if '__init__' in vars(klass) and klass is not object]
+    if not all(issubclass(klass, Training) for klass in owners):
+        return False
+    for klass, parent in zip(owners, owners[1:] + [None]):
+        definition = _method_definition(vars(klass)['__init__'])
+        if definition is None:
+            return False
+        arguments = definition.args
+        if (arguments.posonlyargs or arguments.vararg
+                or arguments.kwonlyargs or arguments.kwarg):
+            return False
+        self_name = arguments.args[0].arg
+        params = [argument.arg for argument in arguments.args[1:]]
+        parent_params = () if parent is None else _training_params(parent)
+        body = definition.body
+        if _is_docstring(body[0]):
+            body = body[1:]
+        if not all(_plain_init_statement(statement, self_name, params,
+                                         parent_params)
+                   for statement in body):
+            return False
+    return True
+
+
+def _plain_init_statement(statement: Any, self_name: str,
+                          params: List[str],
+                          parent_params: Tuple[str, ...]) -> bool:
+    """``self.p = p`` или ``super().__init__(<parent_params>)``."""
+    import ast
+
+    if isinstance(statement, ast.Assign):
+        return (len(statement.targets) == 1
+                and isinstance(statement.value, ast.Name)
+                and statement.value.id in params
+                and _self_attribute(statement.targets[0],
+                                    self_name) == statement.value.id)
+    call = statement.value if isinstance(statement, ast.Expr) else None
+    if not isinstance(call, ast.Call) or call.keywords:
+        return False
+    parent_init = call.func
+    return (isinstance(parent_init, ast.Attribute)
+            and parent_init.attr == '__init__'
+            and isinstance(parent_init.value, ast.Call)
+            and isinstance(parent_init.value.func, ast.Name)
+            and parent_init.value.func.id == 'super'
+            and not parent_init.value.args
+            and [getattr(argument, 'id', None) for argument in call.args]
+            == list(parent_params)
+            and all(isinstance(argument, ast.Name) and argument.id in params
+                    for argument in call.args))
+
+
+def _is_docstring(statement: Any) -> bool:
+    import ast
+
+    return (isinstance(statement, ast.Expr)
+            and isinstance(statement.value, ast.Constant)
+            and isinstance(statement.value.value, str))
+
+
+def _self_attribute(node: Any, self_name: str) -> Optional[str]:
+    """Имя ``X`` для узла ``self.X``, иначе ``None``."""
+    import ast
+
+    if (isinstance(node, ast.Attribute)
+            and isinstance(node.value, ast.Name)
+            and node.value.id == self_name):
+        return node.attr
+    return None
+
+
+def _kernel_constant(training_class: type[Training], name: Optional[str],
+                     constant: Optional[Callable[[Any], Any]],
+                     namespace: Dict[str, Any]) -> Any:
+    """Узел ядра для числовой константы класса ``name``."""
+    import ast
+
+    value = getattr(training_class, name or '', None)
+    if type(value) not in (int, float):
+        raise ValueError(f'{name} не числовая константа')
+    if constant is None:
+        return ast.Constant(value)
+    namespace[name] = constant(value)
+    return ast.Name(name, ast.Load())
+
+
+def _formula_inliner(training_class: type[Training], self_name: str,
+                     results: Dict[str, str],
+                     constant: Optional[Callable[[Any], Any]],
+                     namespace: Dict[str, Any]) -> Any:
+    """``NodeTransformer``, переводящий выражение метода в выражение ядра.
+
+    На всё, что не сводится к формуле, бросает ``ValueError``.
+    """
+    import ast
+    import copy
+
+    params = _training_params(training_class)
+    arithmetic = (ast.BinOp, ast.UnaryOp, ast.Constant, ast.operator,
+                  ast.unaryop, ast.expr_context)
+
+    class Inliner(ast.NodeTransformer):
+        def __init__(self) -> None:
+            # Имя в методе -> выражение ядра: аргументы и локальные
+            # переменные, уже свёрнутые в формулы.
+            self.names: Dict[str, Any] = {}
+
+        def generic_visit(self, node: ast.AST) -> ast.AST:
+            if not isinstance(node, arithmetic):
+                raise ValueError(f'{type(node).__name__} вне формулы')
+            return super().generic_visit(node)
+
+        def visit_Name(self, node: ast.Name) -> ast.AST:
+            if node.id not in self.names:
+                raise ValueError(f'{node.id} вне формулы')
+            return copy.deepcopy(self.names[node.id])
+
+        def visit_Call(self, node: ast.Call) -> ast.AST:
+            name = _self_attribute(node.func, self_name)
+            if name not in results or node.args or node.keywords:
+                raise ValueError('вызов вне формулы')
+            return ast.Name(results[name], ast.Load())
+
+        def visit_Attribute(self, node: ast.Attribute) -> ast.AST:
+            name = _self_attribute(node, self_name)
+            if name in params:
+                return ast.Name(name, ast.Load())
+            return _kernel_constant(training_class, name, constant,
+                                    namespace)
+
+    return Inliner()
+
+
+def _to_decimal(value: Any) -> Any:
+    from decimal import Decimal
+
+    # str, а не сам float: 0.65 -> Decimal('0.65'), а не двоичное
+    # приближение 0.65000000000000002220446...
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def _calculate_info_decimal(training_class: type[Training],
+                            data: Sequence[float]) -> InfoMessage:
+    """Расчёт в ``Decimal`` с точностью ``AUDIT_PRECISION`` цифр."""
+    import decimal
+
+    if training_class not in _DECIMAL_KERNELS:
+        _DECIMAL_KERNELS[training_class] = _build_kernel(training_class,
+                                                         _to_decimal)
+    entry = _DECIMAL_KERNELS[training_class]
+    if entry is None:
+        raise ValueError(
+            f'Для режима decimal методы расчёта '
+            f'{training_class.__name__} должны сводиться к формулам'
+        )
+    kernel, duration_index = entry
+    values = [_to_decimal(value) for value in data]
+    with decimal.localcontext() as context:
+        context.prec = AUDIT_PRECISION
+        context.rounding = decimal.ROUND_HALF_EVEN
+        distance, speed, calories = kernel(*values)
+    return InfoMessage(training_class.__name__, values[duration_index],
+                       distance, speed, calories)
+
+
+def calculate_info(workout_type: str, data: Sequence[float],
+                   numeric: str = 'float64') -> InfoMessage:
+    """То же, что ``read_package(...).show_training_info()``.
+
+    Для видов с ядром считает одним вызовом ``fused_kernel`` без
+    создания объекта тренировки, для остальных - через методы.
+    ``numeric='decimal'`` считает те же формулы в ``Decimal``: значения
+    пакета и константы переводятся из их десятичной записи, результат
+    воспроизводим на любой платформе.
+    """
+    training_class, entry = _dispatch(workout_type)
+    if numeric != 'float64':
+        if numeric != 'decimal':
+            raise ValueError(f'Режим {numeric} не поддерживается '
+                             f'для отдельных пакетов')
+        return _calculate_info_decimal(training_class, data)
+    if entry is None:
+        return training_class(*data).show_training_info()
+    return _kernel_info(training_class, entry, data)
+
+
+def _dispatch(workout_type: str
+              ) -> Tuple[type[Training], Optional[Tuple[_Kernel, int]]]:
+    """Класс тренировки по коду и его ядро (``None``, если ядра нет)."""
+    training_class = TYPES_OF_TRAINING.get(workout_type)
+    if training_class is None:
+        raise UnknownWorkoutType('Неизвестный тип тренировки')
+    return training_class, (_KERNELS.get(training_class)
+                            or _kernel_entry(training_class))
+
+
+def _kernel_info(training_class: type[Training],
+                 entry: Tuple[_Kernel, int],
+                 data: Sequence[float]) -> InfoMessage:
+    """Сообщение о тренировке, посчитанное ядром ``entry``."""
+    kernel, duration_index = entry
+    distance, speed, calories = kernel(*data)
+    return InfoMessage(training_class.__name__, data[duration_index],
+                       distance, speed, calories)
+
+
+def calculate_batch(workout_types: Sequence[str],
+                    action: Sequence[float],
+                    duration: Sequence[float],
+                    weight: Sequence[float],
+                    height: Optional[Sequence[float]] = None,
+                    length_pool: Optional[Sequence[float]] = None,
+                    count_pool: Optional[Sequence[float]] = None,
+                    dtype: str = 'float64') -> Dict[str, Any]:
+    """Рассчитать дистанцию, скорость и калории для столбцов пакетов.
+
+    Каждый аргумент - столбец одинаковой длины, строка i описывает
+    одну тренировку. Для каждого вида тренировки класс создаётся один
+    раз от срезов столбцов NumPy, поэтому используются те же формулы
+    и константы, что и в скалярных методах. Коды тренировок могут быть
+    строками или байтами (как в двоичном формате). ``dtype='float32'``
+    вдвое уменьшает объём столбцов и результатов ценой точности (см.
+    README).
+    """
+    import numpy as np
+
+    if dtype not in ('float64', 'float32'):
+        raise ValueError(f'Массивы считаются в float64 или float32, '
+                         f'а не в {dtype}')
+
+    codes = np.asarray(workout_types)
+    columns = {
+        'action': action,
+        'duration': duration,
+        'weight': weight,
+        'height': height,
+        'length_pool': length_pool,
+        'count_pool': count_pool,
+    }
+    columns = {name: None if column is None
+               else np.asarray(column, dtype=dtype)
+               for name, column in columns.items()}
+    size = len(codes)
+    result = {
+        'distance': np.empty(size, dtype=dtype),
+        'speed': np.empty(size, dtype=dtype),
+        'calories': np.empty(size, dtype=dtype),
+    }
+    unknown = np.ones(size, dtype=bool)
+    encoded = codes.dtype.kind == 'S'
+    for code, training_class in TYPES_OF_TRAINING.items():
+        mask = codes == (code.encode('ascii') if encoded else code)
+        if not mask.any():
+            continue
+        unknown &= ~mask
+        kwargs = {}
+        for name in _training_params(training_class):
+            if columns[name] is None:
+                raise ValueError(
+                    f'Для тренировки {code} нужен столбец {name}'
+                )
+            kwargs[name] = columns[name][mask]
+        training = training_class(**kwargs)
+        distance = training.get_distance()
+        speed = _speed_at(training, distance)
+        result['distance'][mask] = distance
+        result['speed'][mask] = speed
+        result['calories'][mask] = _calories_at(training, speed)
+    if unknown.any():
+        raise UnknownWorkoutType('Неизвестный тип тренировки')
+    return result
+
+
+SECONDS_IN_HOUR = 3600
+# Поля, которые приходят отсчётами и суммируются за сессию.
+SAMPLED_FIELDS = ('action', 'count_pool')
+
+
+def _chunk_sum(values: Sequence[float], start: int, stop: int) -> float:
+    part = values[start:stop]
+    total = part.sum() if hasattr(part, 'sum') else sum(part)
+    return total.item() if hasattr(total, 'item') else total
+
+
+class TrainingSession:
+    """Тренировка, которая приходит отсчётами по мере записи.
+
+    ``update`` принимает очередной блок отсчётов (шаги или гребки за
+    ``sample_seconds`` секунд, для плавания ещё ``count_pool`` -
+    пройденные бассейны, необязательно ``heart_rate``) и обновляет суммы
+    сессии; сами блоки не хранятся. Дистанция, скорость и калории
+    считаются формулами класса тренировки по суммам на текущий момент,
+    поэтому итог совпадает с расчётом по сводному пакету. Если задан
+    ``report_seconds``, ``update`` возвращает промежуточные сообщения на
+    каждой границе интервала, в том числе внутри блока.
+    """
+
+    def __init__(self, workout_type: str, sample_seconds: float = 1.0,
+                 report_seconds: Optional[float] = None,
+                 **params: float) -> None:
+        training_class = TYPES_OF_TRAINING.get(workout_type)
+        if training_class is None:
+            raise UnknownWorkoutType('Неизвестный тип тренировки')
+        if sample_seconds <= 0:
+            raise ValueError('sample_seconds должен быть больше нуля')
+        names = _training_params(training_class)
+        static = [name for name in names
+                  if name != 'duration' and name not in SAMPLED_FIELDS]
+        if sorted(params) != sorted(static):
+            raise TypeError(
+                f'Для тренировки {workout_type} нужны параметры '
+                f'{", ".join(static)}'
+            )
+        self.workout_type = workout_type
+        self.sample_seconds = sample_seconds
+        self._names = names
+        self._params = params
+        self.totals = {name: 0 for name in names if name in SAMPLED_FIELDS}
+        self.samples = 0
+        self._heart_rate_sum = 0.0
+        self._heart_rate_count = 0
+        self._report_samples = 0
+        if report_seconds is not None:
+            self._report_samples = max(1, round(report_seconds
+                                                / sample_seconds))
+        self._next_report = self._report_samples
+
+    @property
+    def duration(self) -> float:
+        """Длительность записанной части сессии в часах."""
+        return self.samples * self.sample_seconds / SECONDS_IN_HOUR
+
+    @property
+    def mean_heart_rate(self) -> Optional[float]:
+        """Средний пульс по отсчётам, в которых он был."""
+        if not self._heart_rate_count:
+            return None
+        return self._heart_rate_sum / self._heart_rate_count
+
+    def update(self, action: Sequence[float],
+               heart_rate: Optional[Sequence[float]] = None,
+               **samples: Sequence[float]) -> List[InfoMessage]:
+        """Учесть блок отсчётов, вернуть промежуточные сообщения."""
+        samples['action'] = action
+        if sorted(samples) != sorted(self.totals):
+            raise TypeError(
+                f'Для тренировки {self.workout_type} нужны отсчёты '
+                f'{", ".join(self.totals)}'
+            )
+        size = len(action)
+        if any(len(values) != size for values in samples.values()) or (
+                heart_rate is not None and len(heart_rate) != size):
+            raise ValueError('Отсчёты в блоке должны быть одной длины')
+        if heart_rate is not None:
+            self._heart_rate_sum += _chunk_sum(heart_rate, 0, size)
+            self._heart_rate_count += size
+        messages = []
+        position = 0
+        while (self._report_samples
+               and self._next_report <= self.samples + size - position):
+            stop = position + self._next_report - self.samples
+            self._add(samples, position, stop)
+            position = stop
+            messages.append(self.info())
+            self._next_report += self._report_samples
+        self._add(samples, position, size)
+        return messages
+
+    def _add(self, samples: Dict[str, Sequence[float]],
+             start: int, stop: int) -> None:
+        if stop <= start:
+            return
+        for name, values in samples.items():
+            self.totals[name] += _chunk_sum(values, start, stop)
+        self.samples += stop - start
+
+    def info(self) -> InfoMessage:
+        """Сообщение о тренировке по отсчётам на текущий момент."""
+        if not self.samples:
+            raise ValueError('В сессии ещё нет отсчётов')
+        data = []
+        for name in self._names:
+            if name == 'duration':
+                data.append(self.duration)
+            elif name in self.totals:
+                data.append(self.totals[name])
+            else:
+                data.append(self._params[name])
+        return calculate_info(self.workout_type, data)
+
+
+def iter_session_messages(session: TrainingSession,
+                          chunks: Iterable[Dict[str, Sequence[float]]]
+                          ) -> Iterator[InfoMessage]:
+    """Промежуточные сообщения по блокам отсчётов и итоговое в конце.
+
+    ``chunks`` - блоки в виде словарей аргументов ``update``, например
+    ``{'action': [2, 3, 2], 'heart_rate': [120, 121, 121]}``; читаются
+    по одному, так в памяти только текущий блок.
+    """
+    for chunk in chunks:
+        yield from session.update(**chunk)
+    yield session.info()
+
+
+class CompactInfoMessage(_Message):
+    """Информационное сообщение о тренировке без ``__dict__``."""
+
+    __slots__ = _Message.FIELDS
+    OUTPUT_TEXT: ClassVar[str] = InfoMessage.OUTPUT_TEXT
+
+
+def _compact_show_training_info(self: Any) -> CompactInfoMessage:
+    """Вернуть информационное сообщение о выполненной тренировке."""
+    distance = self.get_distance()
+    speed = _speed_at(self, distance)
+    return CompactInfoMessage(type(self).__name__,
+                              self.duration,
+                              distance,
+                              speed,
+                              _calories_at(self, speed)
+                              )
+
+
+_COMPACT_CLASSES: Dict[type, type] = {}
+
+
+def compact_class(training_class: type[Training]) -> type:
+    """Собрать вариант класса тренировки на ``__slots__``.
+
+    Константы и методы расчёта берутся из ``training_class`` и его
+    родителей, поэтому результаты совпадают. Экземпляры не имеют
+    ``__dict__`` и не являются наследниками ``Training``.
+    """
+    compact = _COMPACT_CLASSES.get(training_class)
+    if compact is None:
+        compact = _COMPACT_CLASSES[training_class] = _build_compact_class(
+            training_class
+        )
+    return compact
+
+
+def _build_compact_class(training_class: type[Training]) -> type:
+    import inspect
+
+    params = _training_params(training_class)
+    namespace: Dict[str, Any] = {}
+    for klass in reversed(training_class.__mro__[:-1]):
+        namespace.update((name, value) for name, value in vars(klass).items()
+                         if not name.startswith('__'))
+
+    def __init__(self: Any, *args: Any) -> None:
+        if len(args) != len(params):
+            raise TypeError(
+                f'{training_class.__name__} ожидает {len(params)} '
+                f'значений, получено {len(args)}'
+            )
+        for name, value in zip(params, args):
+            setattr(self, name, value)
+
+    namespace.update(
+        __slots__=params,
+        __init__=__init__,
+        __signature__=inspect.signature(training_class),
+        __doc__=training_class.__doc__,
+        __module__=__name__,
+        __qualname__='Compact' + training_class.__name__,
+        show_training_info=_compact_show_training_info,
+    )
+    return type(training_class.__name__, (), namespace)
+
+
+_COMPACT_NAMES = {
+    'CompactTraining': 'Training',
+    'CompactRunning': 'Running',
+    'CompactSportsWalking': 'SportsWalking',
+    'CompactSwimming': 'Swimming',
+}
+
+
+def __getattr__(name: str) -> Any:
+    """Собирать ``CompactRunning`` и др. при первом обращении."""
+    if name in _COMPACT_NAMES:
+        return compact_class(globals()[_COMPACT_NAMES[name]])
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+class TrainingBatch:
+    """Набор тренировок, хранящийся по столбцам.
+
+    Каждое поле пакета лежит в отдельном типизированном ``array``
+    (8 байт на значение), код тренировки - индекс в ``codes``
+    (1 байт). Неиспользуемые видом тренировки поля равны нулю.
+    """
+
+    COLUMNS: ClassVar[Tuple[str, ...]] = ('action', 'duration', 'weight',
+                                          'height', 'length_pool',
+                                          'count_pool')
+    __slots__ = ('codes', 'type_index', 'columns')
+
+    def __init__(self,
+                 packages: Iterable[Tuple[str, list]] = ()) -> None:
+        from array import array
+
+        self.codes: List[str] = list(TYPES_OF_TRAINING)
+        self.type_index = array('B')
+        self.columns: Dict[str, array] = {
+            name: array('d') for name in self.COLUMNS
+        }
+        self.extend(packages)
+
+    def __len__(self) -> int:
+        return len(self.type_index)
+
+    def append(self, workout_type: str, data: list) -> None:
+        """Добавить пакет от датчиков."""
+        if workout_type not in TYPES_OF_TRAINING:
+            raise UnknownWorkoutType('Неизвестный тип тренировки')
+        params = _training_params(TYPES_OF_TRAINING[workout_type])
+        if len(data) != len(params):
+            raise TypeError(
+                f'Для тренировки {workout_type} нужно {len(params)} '
+                f'значений, получено {len(data)}'
+            )
+        if workout_type not in self.codes:
+            self.codes.append(workout_type)
+        self.type_index.append(self.codes.index(workout_type))
+        row = dict(zip(params, data))
+        for name, column in self.columns.items():
+            column.append(row.get(name, 0.0))
+
+    def extend(self, packages: Iterable[Tuple[str, list]]) -> None:
+        """Добавить несколько пакетов."""
+        for workout_type, data in packages:
+            self.append(workout_type, data)
+
+    def __getitem__(self, index: int) -> Training:
+        """Создать объект тренировки для строки ``index``."""
+        workout_type = self.codes[self.type_index[index]]
+        training_class = TYPES_OF_TRAINING[workout_type]
+        return training_class(*(self.columns[name][index]
+                                for name in _training_params(training_class)))
+
+    def calculate(self) -> Dict[str, Any]:
+        """Рассчитать все тренировки через ``calculate_batch``.
+
+        Столбцы передаются в NumPy без копирования.
+        """
+        import numpy as np
+
+        codes = np.array(self.codes)
+        type_index = np.frombuffer(self.type_index, dtype=np.uint8)
+        columns = {name: np.frombuffer(column, dtype=np.float64)
+                   for name, column in self.columns.items()}
+        return calculate_batch(codes[type_index], **columns)
+
+
+# Двоичный формат: 8 байт сигнатуры, затем записи фиксированной длины
+# в порядке little-endian. Пакет - код тренировки (4 байта ASCII,
+# дополненный нулями) и столбцы TrainingBatch.COLUMNS как float64.
+# Результат - имя класса тренировки (16 байт UTF-8) и поля InfoMessage.
+PACKAGE_MAGIC = b'HWPKG\x00\x01\x00'
+CODE_BYTES = 4
+PACKAGE_RECORD = f'<{CODE_BYTES}s6d'
+RESULT_MAGIC = b'HWRES\x00\x01\x00'
+NAME_BYTES = 16
+RESULT_RECORD = f'<{NAME_BYTES}s4d'
+BINARY_READ_ROWS = 65536
+
+
+def _fixed_field(text: str, size: int, encoding: str = 'utf-8') -> bytes:
+    """Закодировать строку для поля фиксированной длины.
+
+    Длинное значение не обрезается молча: обрезанный код читается как
+    другой вид тренировки, а обрезка UTF-8 посреди символа ломает
+    декодирование.
+    """
+    value = text.encode(encoding)
+    if len(value) > size:
+        raise ValueError(f'{text!r} не помещается в поле двоичного '
+                         f'формата ({len(value)} > {size} байт)')
+    return value
+
+
+def write_packages_binary(packages: Iterable[Tuple[str, list]],
+                          output: BinaryIO) -> int:
+    """Записать пакеты в двоичном формате, вернуть их количество."""
+    from struct import Struct
+
+    record = Struct(PACKAGE_RECORD)
+    output.write(PACKAGE_MAGIC)
+    count = 0
+    for workout_type, data in packages:
+        training_class = TYPES_OF_TRAINING.get(workout_type)
+        if training_class is None:
+            raise UnknownWorkoutType('Неизвестный тип тренировки')
+        params = _training_params(training_class)
+        if len(data) != len(params):
+            raise TypeError(
+                f'Для тренировки {workout_type} нужно {len(params)} '
+                f'значений, получено {len(data)}'
+            )
+        row = dict(zip(params, data))
+        output.write(record.pack(
+            _fixed_field(workout_type, CODE_BYTES, 'ascii'),
+            *(row.get(name, 0.0) for name in TrainingBatch.COLUMNS)
+        ))
+        count += 1
+    return count
+
+
+def convert_to_binary(lines: Iterable[str], output: BinaryIO) -> int:
+    """Перевести построчные пакеты JSON в двоичный формат."""
+    return write_packages_binary(iter_packages(lines), output)
+
+
+def _map_binary(path: str, magic: bytes, dtype: Any) -> Any:
+    """Отобразить двоичный файл в память как массив записей NumPy."""
+    import numpy as np
+
+    with open(path, 'rb') as source:
+        if source.read(len(magic)) != magic:
+            raise ValueError(f'{path}: неизвестный двоичный формат')
+        size = source.seek(0, io.SEEK_END) - len(magic)
+    if size % dtype.itemsize:
+        raise ValueError(f'{path}: файл обрезан')
+    if not size:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=len(magic))
+
+
+def _package_dtype() -> Any:
+    import numpy as np
+
+    return np.dtype([('workout_type', f'S{CODE_BYTES}')]
+                    + [(name, '<f8') for name in TrainingBatch.COLUMNS])
+
+
+def _result_dtype() -> Any:
+    import numpy as np
+
+    return np.dtype([('training_type', f'S{NAME_BYTES}'),
+                     ('duration', '<f8'),
+                     ('distance', '<f8'), ('speed', '<f8'),
+                     ('calories', '<f8')])
+
+
+def map_packages_binary(path: str) -> Any:
+    """Массив записей пакетов поверх файла, без копирования данных."""
+    return _map_binary(path, PACKAGE_MAGIC, _package_dtype())
+
+
+def map_results_binary(path: str) -> Any:
+    """Массив записей результатов поверх файла, без копирования."""
+    return _map_binary(path, RESULT_MAGIC, _result_dtype())
+
+
+def calculate_binary(path: str, dtype: str = 'float64') -> Dict[str, Any]:
+    """Рассчитать все пакеты двоичного файла через ``calculate_batch``.
+
+    Столбцы - представления отображённого в память файла, списки
+    Python на пакет не создаются (для ``float32`` столбцы копируются
+    с преобразованием).
+    """
+    records = map_packages_binary(path)
+    columns = {name: records[name] for name in TrainingBatch.COLUMNS}
+    return calculate_batch(records['workout_type'], dtype=dtype, **columns)
+
+
+def write_results_binary(workout_types: Any,
+                         duration: Any,
+                         result: Dict[str, Any],
+                         output: BinaryIO) -> int:
+    """Записать результаты ``calculate_batch`` в двоичном формате."""
+    import numpy as np
+
+    codes = np.asarray(workout_types)
+    records = np.zeros(len(codes), dtype=_result_dtype())
+    for code, training_class in TYPES_OF_TRAINING.items():
+        key = code.encode('ascii') if codes.dtype.kind == 'S' else code
+        selected = codes == key
+        if selected.any():
+            records['training_type'][selected] = _fixed_field(
+                training_class.__name__, NAME_BYTES
+            )
+    records['duration'] = duration
+    for name in ('distance', 'speed', 'calories'):
+        records[name] = result[name]
+    output.write(RESULT_MAGIC)
+    output.write(records.tobytes())
+    return len(records)
+
+
+def write_messages_binary(messages: Iterable[Any],
+                          output: BinaryIO) -> int:
+    """Записать сообщения ``InfoMessage`` в двоичном формате."""
+    from struct import Struct
+
+    record = Struct(RESULT_RECORD)
+    output.write(RESULT_MAGIC)
+    count = 0
+    for message in messages:
+        output.write(record.pack(
+            _fixed_field(message.training_type, NAME_BYTES),
+            message.duration,
+            message.distance, message.speed, message.calories
+        ))
+        count += 1
+    return count
+
+
+def iter_batch_messages(workout_types: Any,
+                        duration: Any,
+                        result: Dict[str, Any]) -> Iterator[InfoMessage]:
+    """Превратить результаты ``calculate_batch`` в ``InfoMessage``."""
+    import numpy as np
+
+    codes = np.asarray(workout_types)
+    names = {}
+    for code, training_class in TYPES_OF_TRAINING.items():
+        key = code.encode('ascii') if codes.dtype.kind == 'S' else code
+        names[key] = training_class.__name__
+    for start in range(0, len(codes), BINARY_READ_ROWS):
+        stop = start + BINARY_READ_ROWS
+        rows = zip(codes[start:stop].tolist(),
+                   np.asarray(duration)[start:stop].tolist(),
+                   result['distance'][start:stop].tolist(),
+                   result['speed'][start:stop].tolist(),
+                   result['calories'][start:stop].tolist())
+        for code, *values in rows:
+            yield InfoMessage(names[code], *values)
+
+
+def iter_results_binary(path: str) -> Iterator[InfoMessage]:
+    """Прочитать двоичный файл результатов как ``InfoMessage``."""
+    records = map_results_binary(path)
+    for start in range(0, len(records), BINARY_READ_ROWS):
+        for record in records[start:start + BINARY_READ_ROWS].tolist():
+            training_type, *values = record
+            yield InfoMessage(training_type.decode('utf-8'), *values)
+
+
+class AggregateStats:
+    """Накопленные суммы по тренировкам."""
+
+    __slots__ = ('count', 'duration', 'distance', 'calories')
+
+    def __init__(self, count: int = 0, duration: float = 0.0,
+                 distance: float = 0.0, calories: float = 0.0) -> None:
+        self.count = count
+        self.duration = duration
+        self.distance = distance
+        self.calories = calories
+
+    def to_dict(self) -> Dict[str, float]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        values = ', '.join(f'{name}={value!r}'
+                           for name, value in self.to_dict().items())
+        return f'AggregateStats({values})'
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, AggregateStats):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def add(self, info: Any) -> None:
+        """Учесть одно сообщение о тренировке."""
+        self.count += 1
+        self.duration += info.duration
+        self.distance += info.distance
+        self.calories += info.calories
+
+    def merge(self, other: 'AggregateStats') -> None:
+        """Добавить суммы другого агрегата."""
+        self.count += other.count
+        self.duration += other.duration
+        self.distance += other.distance
+        self.calories += other.calories
+
+    @property
+    def mean_distance(self) -> float:
+        return self.distance / self.count if self.count else 0.0
+
+    @property
+    def mean_calories(self) -> float:
+        return self.calories / self.count if self.count else 0.0
+
+    @property
+    def mean_speed(self) -> float:
+        return self.distance / self.duration if self.duration else 0.0
+
+
+class TrainingAggregator:
+    """Накопительные итоги по пользователям во временных окнах.
+
+    Время делится на корзины по ``window / slices`` секунд, сообщение
+    добавляется в свою корзину за O(1). Запрос складывает ``slices``
+    последних корзин: при ``slices=1`` окна неперекрывающиеся
+    (tumbling), при большем ``slices`` окно скользит с шагом в одну
+    корзину. Корзины старше окна от самого позднего события удаляются,
+    опоздавшие в них события не учитываются и считаются в ``dropped``.
+    Агрегаторы шардов сливаются через ``merge`` (см. там).
+    """
+
+    def __init__(self, window: float = 7 * 24 * 3600,
+                 slices: int = 1) -> None:
+        if window <= 0 or slices < 1:
+            raise ValueError('Окно и число корзин должны быть больше нуля')
+        self.window = window
+        self.slices = slices
+        self.step = window / slices
+        self.latest: Optional[int] = None
+        self.dropped = 0
+        self._buckets: Dict[int, Dict[Any, Dict[str, AggregateStats]]] = {}
+
+    def _bucket(self, timestamp: float) -> int:
+        return int(timestamp // self.step)
+
+    def add(self, user_id: Any, timestamp: float, info: Any) -> None:
+        """Учесть сообщение ``info`` пользователя ``user_id``."""
+        bucket = self._bucket(timestamp)
+        if self.latest is None or bucket > self.latest:
+            self.latest = bucket
+            self._evict()
+        elif bucket <= self.latest - self.slices:
+            self.dropped += 1
+            return
+        users = self._buckets.setdefault(bucket, {})
+        types = users.setdefault(user_id, {})
+        stats = types.get(info.training_type)
+        if stats is None:
+            stats = types[info.training_type] = AggregateStats()
+        stats.add(info)
+
+    def merge(self, other: 'TrainingAggregator') -> None:
+        """Добавить итоги другого агрегатора с тем же окном.
+
+        Каждый шард ведёт своё ``latest`` по своим событиям, а корзины,
+        выпавшие из общего окна, удаляются здесь, по большему
+        ``latest``. Для шардов по пользователям пары пользователь-корзина
+        не пересекаются, и итоги за окно совпадают с агрегатором одного
+        узла: шард отбрасывает только то, что отбросил бы и один узел, а
+        принятые им лишние опоздавшие события лежат в корзинах вне
+        общего окна. Поэтому ``dropped`` слитого агрегатора может быть
+        меньше, чем у одного узла.
+        """
+        if (other.window, other.slices) != (self.window, self.slices):
+            raise ValueError('Окна агрегаторов не совпадают')
+        self.dropped += other.dropped
+        for bucket, users in other._buckets.items():
+            own_users = self._buckets.setdefault(bucket, {})
+            for user_id, types in users.items():
+                own_types = own_users.setdefault(user_id, {})
+                for training_type, stats in types.items():
+                    own_types.setdefault(training_type,
+                                         AggregateStats()).merge(stats)
+        if other.latest is not None:
+            if self.latest is None or other.latest > self.latest:
+                self.latest = other.latest
+            self._evict()
+
+    def _evict(self) -> None:
+        """Удалить корзины, выпавшие из окна."""
+        border = self.latest - self.slices
+        for bucket in [bucket for bucket in self._buckets
+                       if bucket <= border]:
+            del self._buckets[bucket]
+
+    def _window(self, now: Optional[float]) -> range:
+        last = self.latest if now is None else self._bucket(now)
+        if last is None:
+            return range(0)
+        return range(last - self.slices + 1, last + 1)
+
+    def by_type(self, user_id: Any,
+                now: Optional[float] = None) -> Dict[str, AggregateStats]:
+        """Итоги пользователя за окно, разбитые по видам тренировок.
+
+        Окно заканчивается корзиной с моментом ``now``, по умолчанию -
+        корзиной самого позднего события.
+        """
+        result: Dict[str, AggregateStats] = {}
+        for bucket in self._window(now):
+            types = self._buckets.get(bucket, {}).get(user_id, {})
+            for training_type, stats in types.items():
+                result.setdefault(training_type, AggregateStats()).merge(
+                    stats
+                )
+        return result
+
+    def totals(self, user_id: Any, now: Optional[float] = None,
+               training_type: Optional[str] = None) -> AggregateStats:
+        """Итоги пользователя за окно по всем или одному виду."""
+        result = AggregateStats()
+        for name, stats in self.by_type(user_id, now).items():
+            if training_type is None or name == training_type:
+                result.merge(stats)
+        return result
+
+    def to_state(self) -> Dict[str, Any]:
+        """Состояние агрегатора в виде, пригодном для JSON."""
+        return {
+            'window': self.window,
+            'slices': self.slices,
+            'latest': self.latest,
+            'dropped': self.dropped,
+            'stats': [[bucket, user_id, training_type, stats.to_dict()]
+                      for bucket, users in self._buckets.items()
+                      for user_id, types in users.items()
+                      for training_type, stats in types.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'TrainingAggregator':
+        """Восстановить агрегатор из ``to_state``."""
+        aggregator = cls(state['window'], state['slices'])
+        aggregator.latest = state['latest']
+        aggregator.dropped = state['dropped']
+        for bucket, user_id, training_type, stats in state['stats']:
+            users = aggregator._buckets.setdefault(bucket, {})
+            types = users.setdefault(user_id, {})
+            types[training_type] = AggregateStats(**stats)
+        return aggregator
+
+    def checkpoint(self, path: str) -> None:
+        """Атомарно сохранить состояние в файл JSON."""
+        import json
+        import os
+
+        temporary = path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as output:
+            json.dump(self.to_state(), output, ensure_ascii=False)
+        os.replace(temporary, path)
+
+    @classmethod
+    def restore(cls, path: str) -> 'TrainingAggregator':
+        """Загрузить агрегатор из файла ``checkpoint``."""
+        import json
+
+        with open(path, encoding='utf-8') as source:
+            return cls.from_state(json.load(source))
+
+
+def main(training: Training, sink: Optional[ResultSink] = None) -> None:
+    """Главная функция.
+
+    С ``sink`` сообщение уходит в приёмник вместо печати.
+    """
     info = training.show_training_info()
+    if sink is not None:
+        sink.write(info)
+        return
     print(info.get_message())
 
 
-if __name__ == '__main__':
-    packages = [
-        ('SWM', [720, 1, 80, 25, 40]),
-        ('RUN', [15000, 1, 75]),
-        ('WLK', [9000, 1, 75, 180]),
-    ]
+DEMO_PACKAGES: List[Tuple[str, list]] = [
+    ('SWM', [720, 1, 80, 25, 40]),
+    ('RUN', [15000, 1, 75]),
+    ('WLK', [9000, 1, 75, 180]),
+]
+
+
+def parse_package(line: str) -> Tuple[str, list]:
+    """Разобрать строку с пакетом в формате JSON.
+
+    Поддерживаются ``["RUN", [15000, 1, 75]]`` и
+    ``{"workout_type": "RUN", "data": [15000, 1, 75]}``.
+    """
+    import json
+
+    package = json.loads(line)
+    if isinstance(package, dict):
+        return package['workout_type'], package['data']
+    workout_type, data = package
+    return workout_type, data
+
+
+def iter_packages(lines: Iterable[str],
+                  start: int = 1,
+                  stats: Optional['StageStats'] = None
+                  ) -> Iterator[Tuple[str, list]]:
+    """Лениво читать пакеты из построчного потока, пропуская пустые.
+
+    ``start`` - номер первой строки, используется в сообщениях об ошибках.
+    С ``stats`` время разбора записывается в этап ``parse``.
+    """
+    parse = parse_package if stats is None else stats.timed_parse
+    for number, line in enumerate(lines, start=start):
+        if not line.strip():
+            continue
+        try:
+            yield parse(line)
+        except (ValueError, KeyError, TypeError) as exc:
+            raise ValueError(
+                f'Строка {number}: некорректный пакет: {exc}'
+            ) from exc
+
+
+# Нижние границы полей пакета: (граница, True - строго больше).
+# Нулевая длительность и рост дают деление на ноль в расчётах.
+FIELD_LIMITS: Dict[str, Tuple[float, bool]] = {
+    'action': (0, False),
+    'duration': (0, True),
+    'weight': (0, True),
+    'height': (0, True),
+    'length_pool': (0, False),
+    'count_pool': (0, False),
+}
 
+
+def _package_parts(package: Any) -> Optional[Tuple[Any, Any]]:
+    """Код и данные разобранного JSON или ``None``, если форма неверна."""
+    if isinstance(package, dict):
+        if 'workout_type' not in package or 'data' not in package:
+            return None
+        parts = package['workout_type'], package['data']
+    elif isinstance(package, list) and len(package) == 2:
+        parts = package[0], package[1]
+    else:
+        return None
+    if not isinstance(parts[0], str) or not isinstance(parts[1], list):
+        return None
+    return parts
+
+
+def _numeric_matrix(rows: List[list]) -> Tuple[Any, List[bool]]:
+    """Перевести строки одной длины в матрицу float.
+
+    Обычно это одно преобразование NumPy на группу. Только если в группе
+    есть нечисловые значения (строки, ``None``, вложенные списки,
+    ``bool``) или числа вне диапазона float, строки проверяются по
+    одной; такие строки заполняются NaN и отмечаются в списке флагов.
+    Типы проверяются до NumPy: ``np.array`` молча приводит ``True``
+    рядом с числами к 1, и вердикт строки зависел бы от соседей.
+    """
+    from itertools import chain
+
+    import numpy as np
+
+    try:
+        if set(map(type, chain.from_iterable(rows))) <= {int, float}:
+            matrix = np.array(rows)
+            if matrix.dtype.kind in 'iuf' and matrix.ndim == 2:
+                return matrix.astype(float), []
+    except (ValueError, OverflowError):
+        pass
+    converted = [_float_row(row) for row in rows]
+    matrix = np.array([row if row is not None else [np.nan] * len(rows[0])
+                       for row in converted], dtype=float)
+    return matrix, [row is None for row in converted]
+
+
+def _float_row(row: list) -> Optional[List[float]]:
+    """Перевести строку в float или вернуть None, если это невозможно."""
+    if not all(type(value) in (int, float) for value in row):
+        return None
+    try:
+        return [float(value) for value in row]
+    except OverflowError:
+        return None
+
+
+def _check_values(params: Tuple[str, ...],
+                  rows: List[list]) -> List[Optional[str]]:
+    """Проверить значения строк одного вида тренировки по столбцам."""
+    import numpy as np
+
+    matrix, not_numeric = _numeric_matrix(rows)
+    bad = np.zeros(len(rows), dtype=bool)
+    if not_numeric:
+        bad |= not_numeric
+    checks = [('not_finite', ~np.isfinite(matrix).all(axis=1))]
+    for column, name in enumerate(params):
+        if name in FIELD_LIMITS:
+            limit, strict = FIELD_LIMITS[name]
+            values = matrix[:, column]
+            checks.append((f'{name}_out_of_range',
+                           values <= limit if strict else values < limit))
+    reasons: List[Optional[str]] = [None] * len(rows)
+    for position in np.flatnonzero(bad):
+        reasons[position] = 'not_numeric'
+    for reason, failed in checks:
+        failed &= ~bad
+        for position in np.flatnonzero(failed):
+            reasons[position] = reason
+        bad |= failed
+    return reasons
+
+
+def validate_packages(packages: Sequence[Any]) -> List[Optional[str]]:
+    """Проверить пакеты и вернуть причину отказа для каждого.
+
+    ``None`` - пакет корректен. Коды причин: ``bad_structure``,
+    ``unknown_type``, ``bad_arity``, ``not_numeric``, ``not_finite``,
+    ``<поле>_out_of_range``. Проверки значений выполняются над
+    столбцами NumPy по группам одного вида тренировки, без исключений
+    на каждую строку.
+    """
+    reasons: List[Optional[str]] = [None] * len(packages)
+    groups: Dict[str, Tuple[List[int], List[list]]] = {}
+    for index, package in enumerate(packages):
+        parts = _package_parts(package)
+        if parts is None:
+            reasons[index] = 'bad_structure'
+            continue
+        training_class = TYPES_OF_TRAINING.get(parts[0])
+        if training_class is None:
+            reasons[index] = 'unknown_type'
+        elif len(parts[1]) != len(_training_params(training_class)):
+            reasons[index] = 'bad_arity'
+        else:
+            indexes, rows = groups.setdefault(parts[0], ([], []))
+            indexes.append(index)
+            rows.append(parts[1])
+    for code, (indexes, rows) in groups.items():
+        params = _training_params(TYPES_OF_TRAINING[code])
+        for index, reason in zip(indexes, _check_values(params, rows)):
+            reasons[index] = reason
+    return reasons
+
+
+_BAD_JSON = object()
+
+
+def iter_valid_packages(lines: Iterable[str],
+                        rejects: Optional[TextIO] = None,
+                        chunk_size: int = 10000,
+                        start: int = 1) -> Iterator[Tuple[str, list]]:
+    """Читать пакеты, отбрасывая некорректные без исключений.
+
+    Строки разбираются и проверяются ``validate_packages`` блоками по
+    ``chunk_size``. Корректные пакеты отдаются дальше, отброшенные
+    пишутся в ``rejects`` строками JSON с номером строки, кодом причины
+    (плюс ``bad_json`` для нечитаемого JSON) и исходным текстом.
+    """
+    import json
+
+    for chunk_start, chunk in _iter_chunks(lines, chunk_size, start):
+        numbers = []
+        packages = []
+        for number, line in enumerate(chunk, start=chunk_start):
+            if not line.strip():
+                continue
+            try:
+                package = json.loads(line)
+            except ValueError:
+                package = _BAD_JSON
+            numbers.append(number)
+            packages.append(package)
+        reasons = validate_packages(packages)
+        for number, package, reason in zip(numbers, packages, reasons):
+            if reason is None:
+                yield _package_parts(package)
+            elif rejects is not None:
+                if package is _BAD_JSON:
+                    reason = 'bad_json'
+                rejects.write(json.dumps(
+                    {'line': number, 'reason': reason,
+                     'package': chunk[number - chunk_start].rstrip('\n')},
+                    ensure_ascii=False
+                ) + '\n')
+
+
+class InfoCache:
+    """LRU-кэш сообщений по пакету ``(workout_type, data)``.
+
+    Повторы пакетов (ретраи устройств, повторные синхронизации) не
+    пересчитываются. Сообщения в кэше общие, изменять их нельзя.
+    """
+
+    def __init__(self, maxsize: int = 100000) -> None:
+        import functools
+
+        self._get = functools.lru_cache(maxsize=maxsize)(self._calculate)
+
+    @staticmethod
+    def _calculate(workout_type: str, data: tuple) -> InfoMessage:
+        return calculate_info(workout_type, data)
+
+    def get_info(self, workout_type: str, data: Sequence) -> InfoMessage:
+        """Вернуть сообщение для пакета, посчитав его при промахе."""
+        return self._get(workout_type, tuple(data))
+
+    @property
+    def hits(self) -> int:
+        return self._get.cache_info().hits
+
+    @property
+    def misses(self) -> int:
+        return self._get.cache_info().misses
+
+    def __len__(self) -> int:
+        return self._get.cache_info().currsize
+
+    def clear(self) -> None:
+        """Очистить кэш и счётчики."""
+        self._get.cache_clear()
+
+
+INDEX_MAGIC = b'HWIDX\x00\x01\x00'
+# Заголовок: слотов, занято, бит фильтра, хешей фильтра.
+INDEX_HEADER = '<QQQQ'
+# Слот: отпечаток пакета и результат в формате RESULT_RECORD.
+INDEX_SLOT = f'<16s{NAME_BYTES}s4d'
+# Фильтр Блума блочный: все биты пакета в одном блоке из 64 байт, то
+# есть в одной кэш-линии и одной странице файла. Позиции битов берутся
+# по 9 бит из второй половины отпечатка, поэтому хешей не больше 7.
+INDEX_BLOOM_BLOCK = 64
+INDEX_MAX_HASHES = 7
+# Доля занятых слотов, после которой индекс считается заполненным.
+INDEX_MAX_LOAD = 0.75
+INDEX_CAPACITY = 10_000_000
+
+
+def package_fingerprint(workout_type: str, data: Sequence[float]) -> bytes:
+    """16 байт BLAKE2b от вида тренировки и значений пакета.
+
+    Значения упаковываются как ``float64``, поэтому ``15000`` и
+    ``15000.0`` дают один отпечаток: результат расчёта у них тоже
+    одинаковый. Нулевой отпечаток занят под пустой слот индекса.
+    """
+    import hashlib
+    import struct
+
+    key = (workout_type.encode('utf-8') + b'\x00'
+           + struct.pack(f'<{len(data)}d', *data))
+    digest = hashlib.blake2b(key, digest_size=16).digest()
+    return digest if any(digest) else b'\x01' + digest[1:]
+
+
+class PackageIndex:
+    """Индекс уже обработанных пакетов на диске.
+
+    Файл: ``INDEX_MAGIC``, заголовок, блочный фильтр Блума и
+    хеш-таблица с открытой адресацией из слотов ``INDEX_SLOT``; всё
+    отображается в память через ``mmap``. Новые пакеты почти всегда
+    отсекаются фильтром по одному блоку без чтения таблицы, повторы
+    находятся за O(1) проб в среднем. Размер задаётся при создании
+    (``capacity`` пакетов, ``error_rate`` - доля ложных срабатываний
+    фильтра); файл разреженный, а в памяти держатся только нужные
+    страницы, поэтому индекс на сотни миллионов пакетов не требует
+    столько же ОЗУ.
+    """
+
+    def __init__(self, path: str, capacity: Optional[int] = None,
+                 error_rate: float = 0.01) -> None:
+        import math
+        import mmap
+        import os
+        import struct
+
+        self.path = path
+        self._slot = struct.Struct(INDEX_SLOT)
+        self._header = struct.Struct(INDEX_HEADER)
+        # Счётчик занятых слотов - второе поле '<Q' заголовка.
+        self._counter = struct.Struct('<Q')
+        self._counter_offset = len(INDEX_MAGIC) + self._counter.size
+        start = len(INDEX_MAGIC) + self._header.size
+        if not os.path.exists(path):
+            if not capacity or capacity < 1 or not 0 < error_rate < 1:
+                raise ValueError('Для нового индекса нужны capacity > 0 '
+                                 'и 0 < error_rate < 1')
+            block_bits = INDEX_BLOOM_BLOCK * 8
+            bits = math.ceil(-capacity * math.log(error_rate)
+                             / math.log(2) ** 2 / block_bits) * block_bits
+            hashes = min(INDEX_MAX_HASHES,
+                         max(1, round(bits / capacity * math.log(2))))
+            slots = math.ceil(capacity / INDEX_MAX_LOAD)
+            with open(path, 'wb') as output:
+                output.write(INDEX_MAGIC)
+                output.write(self._header.pack(slots, 0, bits, hashes))
+                output.truncate(start + bits // 8 + slots * self._slot.size)
+        self._file = open(path, 'r+b')
+        if self._file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            self._file.close()
+            raise ValueError(f'{path}: неизвестный формат индекса')
+        self.slots, self._count, self.bits, self.hashes = (
+            self._header.unpack(self._file.read(self._header.size))
+        )
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._bloom_start = start
+        self._blocks = self.bits // (INDEX_BLOOM_BLOCK * 8)
+        self._table_start = start + self.bits // 8
+        if len(self._map) != (self._table_start
+                              + self.slots * self._slot.size):
+            self.close()
+            raise ValueError(f'{path}: файл индекса обрезан')
+        self.filtered = 0
+
+    def __enter__(self) -> 'PackageIndex':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _bloom_block(self, fingerprint: bytes) -> Tuple[int, int]:
+        """Смещение блока фильтра и маска битов отпечатка в нём."""
+        first = int.from_bytes(fingerprint[:8], 'little')
+        second = int.from_bytes(fingerprint[8:], 'little')
+        mask = 0
+        for _ in range(self.hashes):
+            mask |= 1 << (second & 511)
+            second >>= 9
+        offset = self._bloom_start + first % self._blocks * INDEX_BLOOM_BLOCK
+        return offset, mask
+
+    def _maybe_seen(self, fingerprint: bytes) -> bool:
+        offset, mask = self._bloom_block(fingerprint)
+        block = int.from_bytes(
+            self._map[offset:offset + INDEX_BLOOM_BLOCK], 'little'
+        )
+        return block & mask == mask
+
+    def _find(self, fingerprint: bytes) -> Tuple[int, bool]:
+        """Смещение слота с отпечатком или пустого слота для него.
+
+        Пробы ограничены числом слотов: таблица без пустых слотов (файл
+        испорчен или заполнен в обход ``INDEX_MAX_LOAD``) даёт
+        ``ValueError``, а не бесконечный цикл.
+        """
+        size = self._slot.size
+        slot = int.from_bytes(fingerprint[:8], 'big') % self.slots
+        for _ in range(self.slots):
+            offset = self._table_start + slot * size
+            stored = self._map[offset:offset + 16]
+            if stored == fingerprint:
+                return offset, True
+            if not any(stored):
+                return offset, False
+            slot = slot + 1 if slot + 1 < self.slots else 0
+        raise ValueError(f'{self.path}: в индексе нет пустых слотов, '
+                         f'файл повреждён')
+
+    def _read(self, offset: int) -> InfoMessage:
+        _, training_type, *values = self._slot.unpack_from(self._map,
+                                                           offset)
+        return InfoMessage(training_type.rstrip(b'\x00').decode('utf-8'),
+                           *values)
+
+    def _store(self, offset: int, fingerprint: bytes, info: Any) -> None:
+        # Хотя бы один слот всегда остаётся пустым, иначе поиск
+        # отсутствующего отпечатка не закончится.
+        if self._count + 1 > self.slots * INDEX_MAX_LOAD:
+            raise ValueError(f'{self.path}: индекс заполнен, '
+                             f'создайте новый с большим capacity')
+        self._slot.pack_into(self._map, offset, fingerprint,
+                             _fixed_field(info.training_type, NAME_BYTES),
+                             info.duration, info.distance, info.speed,
+                             info.calories)
+        block_start, mask = self._bloom_block(fingerprint)
+        block_end = block_start + INDEX_BLOOM_BLOCK
+        block = int.from_bytes(self._map[block_start:block_end],
+                               'little') | mask
+        self._map[block_start:block_end] = block.to_bytes(INDEX_BLOOM_BLOCK,
+                                                          'little')
+        self._count += 1
+        # Счётчик пишется в заголовок сразу, а не только во flush: после
+        # сбоя устаревший счётчик пропустил бы проверку заполнения.
+        self._counter.pack_into(self._map, self._counter_offset,
+                                self._count)
+
+    def get(self, workout_type: str,
+            data: Sequence[float]) -> Optional[InfoMessage]:
+        """Сохранённое сообщение для пакета или ``None``."""
+        fingerprint = package_fingerprint(workout_type, data)
+        if not self._maybe_seen(fingerprint):
+            self.filtered += 1
+            return None
+        offset, found = self._find(fingerprint)
+        return self._read(offset) if found else None
+
+    def add(self, workout_type: str, data: Sequence[float],
+            info: Any) -> bool:
+        """Запомнить результат пакета; ``False``, если пакет уже был."""
+        fingerprint = package_fingerprint(workout_type, data)
+        offset, found = self._find(fingerprint)
+        if not found:
+            self._store(offset, fingerprint, info)
+        return not found
+
+    def get_or_add(self, workout_type: str,
+                   data: Sequence[float]) -> Tuple[InfoMessage, bool]:
+        """Сообщение пакета и признак, что пакет уже был в индексе.
+
+        Новый пакет считается ``calculate_info`` и запоминается;
+        отпечаток при этом вычисляется один раз.
+        """
+        fingerprint = package_fingerprint(workout_type, data)
+        if self._maybe_seen(fingerprint):
+            offset, found = self._find(fingerprint)
+            if found:
+                return self._read(offset), True
+        else:
+            self.filtered += 1
+            offset, _ = self._find(fingerprint)
+        info = calculate_info(workout_type, data)
+        self._store(offset, fingerprint, info)
+        return info, False
+
+    def flush(self) -> None:
+        """Записать счётчик и изменённые страницы на диск."""
+        self._header.pack_into(self._map, len(INDEX_MAGIC), self.slots,
+                               self._count, self.bits, self.hashes)
+        self._map.flush()
+
+    def close(self) -> None:
+        if not self._map.closed:
+            self.flush()
+            self._map.close()
+        self._file.close()
+
+
+def iter_deduplicated(packages: Iterable[Tuple[str, Sequence[float]]],
+                      index: PackageIndex,
+                      serve: bool = False) -> Iterator[InfoMessage]:
+    """Сообщения для пакетов, которых ещё нет в ``index``.
+
+    Новые пакеты считаются и попадают в индекс. Уже виденные
+    пропускаются, а с ``serve=True`` выдаются из сохранённых
+    результатов без пересчёта.
+    """
     for workout_type, data in packages:
-        training = read_package(workout_type, data)
-        main(training)
+        info, seen = index.get_or_add(workout_type, data)
+        if serve or not seen:
+            yield info
+
+
+class StageStats:
+    """Счётчики и время этапов обработки по видам тренировок.
+
+    Замеры делает отдельный путь обработки ``process``, поэтому без
+    ``StageStats`` обычный путь ничего не платит за инструментирование.
+    Этапы те же, что у ``calculate_info``: выбор класса и ядра, расчёт
+    и вывод сообщения. Ядро считает дистанцию, скорость и калории одним
+    выражением, поэтому для него есть только ``calculate``; при расчёте
+    методами внутри ``calculate`` отдельно замеряются ``distance``,
+    ``speed`` и ``calories`` (если ``show_training_info`` не свой).
+    """
+
+    STAGES: ClassVar[Tuple[str, ...]] = ('parse', 'dispatch', 'calculate',
+                                         'distance', 'speed', 'calories',
+                                         'render')
+
+    def __init__(self) -> None:
+        from collections import Counter
+
+        self.calls: Dict[Tuple[str, str], int] = Counter()
+        self.nanoseconds: Dict[Tuple[str, str], int] = Counter()
+
+    def record(self, stage: str, workout_type: str,
+               nanoseconds: int) -> None:
+        """Учесть один вызов этапа."""
+        key = (stage, workout_type)
+        self.calls[key] += 1
+        self.nanoseconds[key] += nanoseconds
+
+    def timed_parse(self, line: str) -> Tuple[str, list]:
+        """``parse_package`` с замером времени."""
+        start = time.perf_counter_ns()
+        workout_type, data = parse_package(line)
+        self.record('parse', workout_type, time.perf_counter_ns() - start)
+        return workout_type, data
+
+    def process(self, packages: Iterable[Tuple[str, list]],
+                output: TextIO) -> int:
+        """То же, что ``process_stream``, с замером каждого этапа."""
+        clock = time.perf_counter_ns
+        record = self.record
+        count = 0
+        for workout_type, data in packages:
+            start = clock()
+            training_class, entry = _dispatch(workout_type)
+            point = clock()
+            record('dispatch', workout_type, point - start)
+            if entry is None:
+                info = self.timed_methods(training_class(*data),
+                                          workout_type)
+            else:
+                info = _kernel_info(training_class, entry, data)
+            start, point = point, clock()
+            record('calculate', workout_type, point - start)
+            output.write(info.get_message() + '\n')
+            record('render', workout_type, clock() - point)
+            count += 1
+        return count
+
+    def timed_methods(self, training: Training,
+                      workout_type: str) -> InfoMessage:
+        """``show_training_info`` с замером дистанции, скорости и калорий."""
+        if _defined_in(type(training), 'show_training_info') is not Training:
+            return training.show_training_info()
+        clock = time.perf_counter_ns
+        start = clock()
+        distance = training.get_distance()
+        point = clock()
+        self.record('distance', workout_type, point - start)
+        speed = _speed_at(training, distance)
+        start, point = point, clock()
+        self.record('speed', workout_type, point - start)
+        calories = _calories_at(training, speed)
+        self.record('calories', workout_type, clock() - point)
+        return InfoMessage(type(training).__name__, training.duration,
+                           distance, speed, calories)
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Срез счётчиков: этап -> вид тренировки -> вызовы и секунды."""
+        result: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (stage, workout_type), calls in sorted(self.calls.items()):
+            seconds = self.nanoseconds[stage, workout_type] / 1e9
+            result.setdefault(stage, {})[workout_type] = {
+                'calls': calls,
+                'seconds': seconds,
+                'mean_seconds': seconds / calls,
+            }
+        return result
+
+    def to_prometheus(self) -> str:
+        """Счётчики в текстовом формате Prometheus."""
+        lines = [
+            '# HELP homework_stage_calls_total Вызовы этапа обработки.',
+            '# TYPE homework_stage_calls_total counter',
+        ]
+        for (stage, workout_type), calls in sorted(self.calls.items()):
+            lines.append(f'homework_stage_calls_total{{stage="{stage}",'
+                         f'workout_type="{workout_type}"}} {calls}')
+        lines += [
+            '# HELP homework_stage_seconds_total Время этапа обработки.',
+            '# TYPE homework_stage_seconds_total counter',
+        ]
+        for (stage, workout_type), value in sorted(self.nanoseconds.items()):
+            lines.append(f'homework_stage_seconds_total{{stage="{stage}",'
+                         f'workout_type="{workout_type}"}} {value / 1e9!r}')
+        return '\n'.join(lines) + '\n'
+
+
+def render_messages(messages: Iterable[Any],
+                    output: TextIO,
+                    buffer_size: int = 1000) -> int:
+    """Записать сообщения в поток, по одному на строку.
+
+    Текст совпадает с ``get_message``. Шаблон разбирается один раз,
+    строки копятся в буфере и пишутся одним ``write`` на
+    ``buffer_size`` сообщений. Возвращает количество сообщений.
+    """
+    count = 0
+    buffer: List[str] = []
+    text = None
+    for message in messages:
+        if message.OUTPUT_TEXT is not text:
+            text = message.OUTPUT_TEXT
+            template, fields = _compile_template(text)
+        buffer.append(template.format(*fields(message)))
+        if len(buffer) == buffer_size:
+            buffer.append('')
+            output.write('\n'.join(buffer))
+            count += buffer_size
+            buffer.clear()
+    if buffer:
+        buffer.append('')
+        output.write('\n'.join(buffer))
+        count += len(buffer) - 1
+    return count
+
+
+SINK_BATCH_SIZE = 1000
+
+
+class ResultSink:
+    """Приёмник сообщений о тренировках с записью блоками.
+
+    ``write`` копит строки результата и отдаёт их ``_write_rows`` блоком
+    по ``batch_size`` штук; ``flush`` записывает неполный блок, ``close``
+    (или выход из ``with``) - остаток и закрывает то, что открыл сам
+    приёмник. ``count`` - сколько сообщений уже записано.
+    """
+
+    def __init__(self, batch_size: int = SINK_BATCH_SIZE) -> None:
+        if batch_size < 1:
+            raise ValueError('batch_size должен быть больше нуля')
+        self.batch_size = batch_size
+        self.count = 0
+        self._rows: List[Any] = []
+
+    def __enter__(self) -> 'ResultSink':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def write(self, info: Any) -> None:
+        """Добавить одно сообщение."""
+        self._rows.append(self._row(info))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, messages: Iterable[Any]) -> int:
+        """Добавить сообщения, вернуть их количество."""
+        start = self.count + len(self._rows)
+        for info in messages:
+            self.write(info)
+        return self.count + len(self._rows) - start
+
+    def flush(self) -> None:
+        """Записать накопленный блок."""
+        if self._rows:
+            rows, self._rows = self._rows, []
+            size = len(rows)
+            self._write_rows(rows)
+            self.count += size
+
+    def close(self) -> None:
+        self.flush()
+
+    def _row(self, info: Any) -> Any:
+        return info._astuple()
+
+    def _write_rows(self, rows: List[Any]) -> None:
+        raise NotImplementedError('Определите _write_rows')
+
+
+class _StreamSink(ResultSink):
+    """Приёмник, который пишет в текстовый поток."""
+
+    def __init__(self, output: TextIO, batch_size: int = SINK_BATCH_SIZE,
+                 close_output: bool = False) -> None:
+        super().__init__(batch_size)
+        self.output = output
+        self._close_output = close_output
+
+    def close(self) -> None:
+        self.flush()
+        if self._close_output:
+            self.output.close()
+        else:
+            self.output.flush()
+
+
+class TextSink(_StreamSink):
+    """Строки ``get_message``, одна запись в поток на блок."""
+
+    def _row(self, info: Any) -> str:
+        template, fields = _compile_template(info.OUTPUT_TEXT)
+        return template.format(*fields(info))
+
+    def _write_rows(self, rows: List[str]) -> None:
+        rows.append('')
+        self.output.write('\n'.join(rows))
+
+
+class JsonlSink(_StreamSink):
+    """Поля сообщения объектом JSON на строку."""
+
+    def __init__(self, output: TextIO, batch_size: int = SINK_BATCH_SIZE,
+                 close_output: bool = False) -> None:
+        import json
+
+        super().__init__(output, batch_size, close_output)
+        # default=str: значения Decimal (режим decimal) пишутся строкой
+        # без потери точности.
+        self._dumps = json.JSONEncoder(ensure_ascii=False,
+                                       default=str).encode
+
+    def _row(self, info: Any) -> str:
+        return self._dumps(info_to_dict(info))
+
+    def _write_rows(self, rows: List[str]) -> None:
+        rows.append('')
+        self.output.write('\n'.join(rows))
+
+
+class CsvSink(_StreamSink):
+    """CSV с заголовком из ``InfoMessage.FIELDS``.
+
+    Поток нужно открывать с ``newline=''``, как требует ``csv``.
+    """
+
+    def __init__(self, output: TextIO, batch_size: int = SINK_BATCH_SIZE,
+                 close_output: bool = False, header: bool = True) -> None:
+        import csv
+
+        super().__init__(output, batch_size, close_output)
+        self._writer = csv.writer(output)
+        if header:
+            self._writer.writerow(InfoMessage.FIELDS)
+
+    def _write_rows(self, rows: List[tuple]) -> None:
+        self._writer.writerows(rows)
+
+
+class SqliteSink(ResultSink):
+    """Таблица SQLite, один ``executemany`` в транзакции на блок.
+
+    ``database`` - путь к файлу или открытое соединение ``sqlite3``;
+    таблица ``table`` создаётся, если её нет.
+    """
+
+    def __init__(self, database: Any, batch_size: int = 10000,
+                 table: str = 'training_results') -> None:
+        import sqlite3
+
+        if not table.isidentifier():
+            raise ValueError(f'Некорректное имя таблицы: {table}')
+        super().__init__(batch_size)
+        self._close_connection = not isinstance(database,
+                                                sqlite3.Connection)
+        self.connection = (sqlite3.connect(database)
+                           if self._close_connection else database)
+        columns = ', '.join(
+            f'{name} {"TEXT" if name == "training_type" else "REAL"}'
+            for name in InfoMessage.FIELDS
+        )
+        with self.connection:
+            self.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} ({columns})'
+            )
+        self._insert = (f'INSERT INTO {table} VALUES '
+                        f'({", ".join("?" * len(InfoMessage.FIELDS))})')
+
+    def _row(self, info: Any) -> tuple:
+        row = info._astuple()
+        if isinstance(info.calories, float):
+            return row
+        # Decimal и числа NumPy sqlite3 не принимает. Столбцы REAL,
+        # поэтому точные значения decimal сохраняются только в текстовых
+        # форматах.
+        return row[:1] + tuple(float(value) for value in row[1:])
+
+    def _write_rows(self, rows: List[tuple]) -> None:
+        with self.connection:
+            self.connection.executemany(self._insert, rows)
+
+    def close(self) -> None:
+        self.flush()
+        if self._close_connection:
+            self.connection.close()
+
+
+SINKS: Dict[str, type[ResultSink]] = {
+    'text': TextSink,
+    'csv': CsvSink,
+    'jsonl': JsonlSink,
+    'sqlite': SqliteSink,
+}
+SINK_EXTENSIONS = {
+    '.txt': 'text',
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.db': 'sqlite',
+    '.sqlite': 'sqlite',
+    '.sqlite3': 'sqlite',
+}
+
+
+def open_sink(path: str, sink_format: Optional[str] = None,
+              batch_size: Optional[int] = None) -> ResultSink:
+    """Открыть приёмник по пути: ``-`` - stdout, формат по расширению.
+
+    Без ``sink_format`` формат выбирается по ``SINK_EXTENSIONS``,
+    неизвестное расширение - текст. ``batch_size`` по умолчанию берётся
+    у класса приёмника.
+    """
+    if sink_format is None:
+        extension = path[path.rfind('.'):].lower() if '.' in path else ''
+        sink_format = SINK_EXTENSIONS.get(extension, 'text')
+    sink_class = SINKS.get(sink_format)
+    if sink_class is None:
+        raise ValueError(f'Неизвестный формат вывода: {sink_format}')
+    kwargs = {} if batch_size is None else {'batch_size': batch_size}
+    if sink_class is SqliteSink:
+        if path == '-':
+            raise ValueError('SQLite пишется только в файл')
+        return SqliteSink(path, **kwargs)
+    if path == '-':
+        return sink_class(sys.stdout, **kwargs)
+    output = open(path, 'w', encoding='utf-8', newline='')
+    return sink_class(output, close_output=True, **kwargs)
+
+
+def process_stream(packages: Iterable[Tuple[str, list]],
+                   output: TextIO,
+                   cache: Optional[InfoCache] = None,
+                   stats: Optional[StageStats] = None) -> int:
+    """Обработать пакеты и записать сообщения в поток.
+
+    Пакеты обрабатываются по одному, поэтому расход памяти не зависит
+    от размера входа. С ``cache`` повторные пакеты берутся из кэша,
+    со ``stats`` замеряется время этапов (вместе их задать нельзя).
+    Возвращает количество обработанных пакетов.
+    """
+    if stats is not None:
+        if cache is not None:
+            raise ValueError('Кэш и замеры этапов несовместимы')
+        return stats.process(packages, output)
+    if cache is not None:
+        messages = (cache.get_info(workout_type, data)
+                    for workout_type, data in packages)
+    else:
+        messages = (calculate_info(workout_type, data)
+                    for workout_type, data in packages)
+    return render_messages(messages, output)
+
+
+def _process_lines_chunk(chunk: Tuple[int, List[str]]) -> Tuple[int, str]:
+    """Обработать блок строк в процессе-воркере.
+
+    Возвращает количество пакетов и готовый текст сообщений блока.
+    """
+    start, lines = chunk
+    output = io.StringIO()
+    count = process_stream(iter_packages(lines, start), output)
+    return count, output.getvalue()
+
+
+def _iter_chunks(lines: Iterable[str],
+                 chunk_size: int,
+                 start: int = 1) -> Iterator[Tuple[int, List[str]]]:
+    """Разбить поток строк на блоки с номером первой строки."""
+    chunk: List[str] = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield start, chunk
+            start += chunk_size
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+
+def process_stream_parallel(lines: Iterable[str],
+                            output: TextIO,
+                            workers: int,
+                            chunk_size: int = 10000) -> int:
+    """Обработать строки с пакетами в пуле процессов.
+
+    Поток режется на блоки по ``chunk_size`` строк, разбор и расчёт
+    выполняются в ``workers`` процессах. В работе одновременно не больше
+    ``2 * workers`` блоков, результаты пишутся в порядке входа.
+    Возвращает количество обработанных пакетов.
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    count = 0
+    pending: Deque[Any] = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in _iter_chunks(lines, chunk_size):
+            pending.append(executor.submit(_process_lines_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                chunk_count, text = pending.popleft().result()
+                output.write(text)
+                count += chunk_count
+        while pending:
+            chunk_count, text = pending.popleft().result()
+            output.write(text)
+            count += chunk_count
+    return count
+
+
+# Поля записи, по которым выбирается шард, в порядке приоритета.
+SHARD_KEYS = ('user_id', 'device_id')
+
+
+def shard_of(key: Any, shards: int) -> int:
+    """Номер шарда для ключа: CRC32 от ``str(key)``, одинаковый везде.
+
+    Встроенный ``hash`` для строк меняется от запуска к запуску, поэтому
+    не подходит для разбиения между машинами.
+    """
+    import zlib
+
+    return zlib.crc32(str(key).encode('utf-8')) % shards
+
+
+def _shard_record(line: str, number: int) -> Tuple[Any, Dict[str, Any]]:
+    """Разобрать запись шардируемого входа, вернуть ключ и запись."""
+    import json
+    import math
+
+    try:
+        record = json.loads(line)
+        key = next(record[name] for name in SHARD_KEYS if name in record)
+        if 'workout_type' not in record or 'data' not in record:
+            raise KeyError('workout_type, data')
+    except (ValueError, KeyError, TypeError, StopIteration) as exc:
+        raise ValueError(
+            f'Строка {number}: нужен объект JSON с workout_type, data '
+            f'и одним из полей {", ".join(SHARD_KEYS)}: {exc!r}'
+        ) from exc
+    timestamp = record.get('timestamp')
+    if timestamp is not None and (type(timestamp) not in (int, float)
+                                  or not math.isfinite(timestamp)):
+        raise ValueError(f'Строка {number}: timestamp должен быть '
+                         f'конечным числом, а не {timestamp!r}')
+    return key, record
+
+
+def _numbered_lines(lines: Iterable[str],
+                    start: int) -> Iterator[Tuple[int, str]]:
+    """Непустые строки с номерами строк общего входа.
+
+    Строка файла из ``split_shards`` начинается с цифр номера (объект
+    JSON так начаться не может), остальные нумеруются с ``start``.
+    """
+    for number, line in enumerate(lines, start=start):
+        if not line.strip():
+            continue
+        if line[:1].isdigit():
+            try:
+                prefix, line = line.split('\t', 1)
+                number = int(prefix)
+            except ValueError as exc:
+                raise ValueError(
+                    f'Строка {number}: перед записью шарда нужны номер '
+                    f'строки и табуляция: {exc!r}'
+                ) from exc
+        yield number, line
+
+
+def split_shards(lines: Iterable[str], outputs: Sequence[TextIO],
+                 start: int = 1) -> List[int]:
+    """Разложить общий вход по ``len(outputs)`` шардам за один проход.
+
+    Каждая запись разбирается один раз и пишется в вывод своего шарда
+    как ``<номер строки>\t<объект JSON>``; такой файл читает
+    ``process_shard``, и узлу шарда не нужно разбирать чужие записи.
+    Возвращает количество записей по шардам.
+    """
+    shards = len(outputs)
+    counts = [0] * shards
+    buffers: List[List[str]] = [[] for _ in range(shards)]
+    for number, line in _numbered_lines(lines, start):
+        key, _ = _shard_record(line, number)
+        shard = shard_of(key, shards)
+        buffer = buffers[shard]
+        buffer.append(f'{number}\t{line.rstrip()}\n')
+        if len(buffer) == SINK_BATCH_SIZE:
+            outputs[shard].write(''.join(buffer))
+            buffer.clear()
+        counts[shard] += 1
+    for output, buffer in zip(outputs, buffers):
+        output.write(''.join(buffer))
+    return counts
+
+
+def process_shard(lines: Iterable[str], shard: int, shards: int,
+                  output: TextIO,
+                  aggregator: Optional[TrainingAggregator] = None,
+                  start: int = 1) -> int:
+    """Обработать часть ``shard`` из ``shards`` общего входа.
+
+    Вход - объекты JSON по строке: ``{"user_id": "u1", "timestamp":
+    1700000000, "workout_type": "RUN", "data": [15000, 1, 75]}``
+    (``timestamp`` нужен только агрегатору, вместо ``user_id`` можно
+    ``device_id``), либо файл шарда из ``split_shards``, где перед
+    объектом стоит номер строки общего входа и табуляция. Из общего
+    входа шард считает только свои записи, но разбирает все; файл из
+    ``split_shards`` содержит только свои. Сообщения пишутся как
+    ``<номер строки>\t<сообщение>`` для ``merge_shard_outputs``.
+    ``aggregator`` видит только события шарда, итоги за общее окно
+    дают агрегаторы, слитые через ``merge``. Возвращает количество
+    своих записей.
+    """
+    if not 0 <= shard < shards:
+        raise ValueError(f'Шард {shard} вне диапазона 0..{shards - 1}')
+    count = 0
+    buffer: List[str] = []
+    for number, line in _numbered_lines(lines, start):
+        key, record = _shard_record(line, number)
+        if shard_of(key, shards) != shard:
+            continue
+        info = calculate_info(record['workout_type'], record['data'])
+        buffer.append(f'{number}\t{info.get_message()}\n')
+        if len(buffer) == SINK_BATCH_SIZE:
+            output.write(''.join(buffer))
+            buffer.clear()
+        timestamp = record.get('timestamp')
+        if aggregator is not None and timestamp is not None:
+            aggregator.add(key, timestamp, info)
+        count += 1
+    output.write(''.join(buffer))
+    return count
+
+
+def merge_shard_outputs(sources: Iterable[Iterable[str]],
+                        output: TextIO) -> int:
+    """Слить выводы ``process_shard`` в порядке строк общего входа.
+
+    Результат совпадает с выводом обработки всего входа на одном узле.
+    Каждый вывод уже упорядочен, поэтому слияние идёт потоком через
+    ``heapq.merge``. Возвращает количество сообщений.
+    """
+    import heapq
+
+    def numbered(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+        for line in lines:
+            number, message = line.split('\t', 1)
+            yield int(number), message
+
+    count = 0
+    for _, message in heapq.merge(*map(numbered, sources)):
+        output.write(message)
+        count += 1
+    return count
+
+
+def merge_shard_states(paths: Iterable[str]) -> TrainingAggregator:
+    """Собрать один агрегатор из ``checkpoint`` всех шардов."""
+    merged: Optional[TrainingAggregator] = None
+    for path in paths:
+        aggregator = TrainingAggregator.restore(path)
+        if merged is None:
+            merged = aggregator
+        else:
+            merged.merge(aggregator)
+    if merged is None:
+        raise ValueError('Нет состояний шардов для слияния')
+    return merged
+
+
+def info_to_dict(info: Any) -> Dict[str, Any]:
+    """Поля сообщения о тренировке в виде словаря, например для JSON."""
+    return {name: getattr(info, name) for name in info.FIELDS}
+
+
+def _error_answer(error: str, response_format: str) -> str:
+    """Строка ответа сервера с ошибкой."""
+    import json
+
+    if response_format == 'json':
+        return json.dumps({'error': error}, ensure_ascii=False)
+    return 'Ошибка: ' + error
+
+
+def _answer_line(line: bytes, response_format: str,
+                 cache: Optional[InfoCache]) -> str:
+    """Посчитать один пакет и вернуть строку ответа сервера.
+
+    Любая ошибка расчёта становится ответом на эту строку: иначе она
+    оборвала бы соединение вместе с ответами на предыдущие строки блока.
+    """
+    try:
+        workout_type, data = parse_package(line.decode('utf-8'))
+        if cache is not None:
+            info = cache.get_info(workout_type, data)
+        else:
+            info = calculate_info(workout_type, data)
+    except Exception as exc:
+        return _error_answer(f'{type(exc).__name__}: {exc}',
+                             response_format)
+    if response_format == 'json':
+        import json
+
+        return json.dumps(info_to_dict(info), ensure_ascii=False)
+    return info.get_message()
+
+
+def _answer_lines(lines: List[bytes], response_format: str,
+                  cache: Optional[InfoCache]) -> bytes:
+    """Ответить на блок строк одним буфером, пустые строки пропустить."""
+    answers = [_answer_line(line, response_format, cache)
+               for line in lines if line.strip()]
+    if not answers:
+        return b''
+    answers.append('')
+    return '\n'.join(answers).encode('utf-8')
+
+
+SERVER_READ_SIZE = 64 * 1024
+
+
+async def _handle_connection(reader: Any, writer: Any,
+                             response_format: str,
+                             cache: Optional[InfoCache],
+                             line_limit: int) -> None:
+    """Обслужить одно соединение с построчными пакетами.
+
+    Все полные строки из прочитанного блока считаются вместе и
+    отправляются одним ``write``. Следующий блок читается только после
+    ``drain``, поэтому медленный клиент притормаживает только себя.
+    """
+    pending = b''
+    try:
+        while True:
+            chunk = await reader.read(SERVER_READ_SIZE)
+            if not chunk:
+                break
+            *lines, pending = (pending + chunk).split(b'\n')
+            if len(pending) > line_limit:
+                error = f'строка длиннее {line_limit} байт'
+                writer.write(
+                    (_error_answer(error, response_format) + '\n')
+                    .encode('utf-8')
+                )
+                break
+            if lines:
+                writer.write(_answer_lines(lines, response_format, cache))
+                await writer.drain()
+        if pending.strip():
+            writer.write(_answer_lines([pending], response_format, cache))
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def start_server(host: str = '127.0.0.1',
+                       port: int = 8765,
+                       response_format: str = 'text',
+                       cache: Optional[InfoCache] = None,
+                       line_limit: int = 64 * 1024) -> Any:
+    """Запустить asyncio-сервер, принимающий пакеты по TCP.
+
+    Клиент шлёт пакеты JSON по одному на строку, сервер отвечает
+    строкой на каждый пакет: текстом ``get_message`` или JSON
+    (``response_format='json'``). Возвращает ``asyncio.Server``.
+    """
+    import asyncio
+
+    def handler(reader: Any, writer: Any) -> Any:
+        return _handle_connection(reader, writer, response_format, cache,
+                                  line_limit)
+
+    return await asyncio.start_server(handler, host, port, backlog=4096)
+
+
+async def start_daemon(path: str,
+                       response_format: str = 'text',
+                       cache: Optional[InfoCache] = None,
+                       line_limit: int = 64 * 1024) -> Any:
+    """Запустить долгоживущий сервер на Unix-сокете ``path``.
+
+    Протокол тот же, что у ``start_server``. Перед запуском прогреваются
+    таблица видов тренировок и шаблон сообщения, поэтому первый запрос
+    не платит за их подготовку. Возвращает ``asyncio.Server``.
+    """
+    import asyncio
+
+    warm_up()
+
+    def handler(reader: Any, writer: Any) -> Any:
+        return _handle_connection(reader, writer, response_format, cache,
+                                  line_limit)
+
+    return await asyncio.start_unix_server(handler, path, backlog=4096)
+
+
+def warm_up() -> None:
+    """Подготовить таблицы, которые иначе строятся на первом пакете."""
+    for training_class in TYPES_OF_TRAINING.values():
+        _training_params(training_class)
+        _kernel_entry(training_class)
+    _compile_template(InfoMessage.OUTPUT_TEXT)
+    for workout_type, data in DEMO_PACKAGES:
+        _answer_line(f'["{workout_type}", {data}]'.encode(), 'json', None)
+
+
+def send_packages(path: str, lines: Iterable[str], output: TextIO,
+                  batch_size: int = 1000) -> int:
+    """Тонкий клиент: отправить пакеты демону и записать ответы.
+
+    Строки уходят блоками по ``batch_size`` пакетов; следующий блок
+    отправляется после чтения всех ответов на текущий, так буферы
+    сокета не переполняются. Возвращает количество ответов.
+    """
+    import socket
+
+    count = 0
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        answers = connection.makefile('rb')
+        batch: List[bytes] = []
+        for line in lines:
+            if line.strip():
+                batch.append(line.rstrip('\n').encode('utf-8'))
+            if len(batch) == batch_size:
+                count += _exchange(connection, answers, batch, output)
+                batch = []
+        if batch:
+            count += _exchange(connection, answers, batch, output)
+    return count
+
+
+def _exchange(connection: Any, answers: Any, batch: List[bytes],
+              output: TextIO) -> int:
+    batch.append(b'')
+    connection.sendall(b'\n'.join(batch))
+    for _ in range(len(batch) - 1):
+        answer = answers.readline()
+        # Ответ демона всегда заканчивается переводом строки; без него
+        # (в том числе b'' при EOF) соединение закрыто до ответа.
+        if not answer.endswith(b'\n'):
+            raise ConnectionError('Демон закрыл соединение, '
+                                  'не ответив на все пакеты')
+        output.write(answer.decode('utf-8'))
+    return len(batch) - 1
+
+
+DAEMON_CACHE_SIZE = 100000
+
+
+async def _serve_forever(args: argparse.Namespace) -> None:
+    if args.daemon:
+        cache = InfoCache(args.cache_size or DAEMON_CACHE_SIZE)
+        server = await start_daemon(args.daemon, args.format, cache)
+    else:
+        cache = InfoCache(args.cache_size) if args.cache_size else None
+        server = await start_server(args.host, args.port, args.format,
+                                    cache)
+    addresses = ', '.join(str(sock.getsockname())
+                          for sock in server.sockets)
+    print(f'Сервер слушает {addresses}', file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def _process_lines(lines: Iterable[str], args: argparse.Namespace) -> int:
+    """Обработать строки в одном процессе или в пуле процессов."""
+    if args.split:
+        return _split_shards(lines, args)
+    if args.shard:
+        return _process_shard(lines, args)
+    if args.workers > 1:
+        return process_stream_parallel(lines, sys.stdout, args.workers)
+    if args.rejects:
+        with open(args.rejects, 'w', encoding='utf-8') as rejects:
+            return _process_packages(iter_valid_packages(lines, rejects),
+                                     args)
+    stats = StageStats() if args.stats else None
+    return _process_packages(iter_packages(lines, stats=stats), args, stats)
+
+
+def _shard_spec(value: str) -> Tuple[int, int]:
+    """Разобрать ``I/N`` для ``--shard``."""
+    import argparse
+
+    try:
+        shard, shards = map(int, value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('ожидается I/N, например 0/4')
+    if not 0 <= shard < shards:
+        raise argparse.ArgumentTypeError(f'шард {shard} вне 0..{shards - 1}')
+    return shard, shards
+
+
+def _split_shards(lines: Iterable[str], args: argparse.Namespace) -> int:
+    from contextlib import ExitStack
+
+    with ExitStack() as stack:
+        outputs = [stack.enter_context(open(f'{args.input}.{shard}', 'w',
+                                            encoding='utf-8'))
+                   for shard in range(args.split)]
+        return sum(split_shards(lines, outputs))
+
+
+def _process_shard(lines: Iterable[str], args: argparse.Namespace) -> int:
+    shard, shards = args.shard
+    aggregator = TrainingAggregator() if args.shard_state else None
+    count = process_shard(lines, shard, shards, sys.stdout, aggregator)
+    if aggregator is not None:
+        aggregator.checkpoint(args.shard_state)
+    return count
+
+
+def _merge_shards(args: argparse.Namespace) -> int:
+    from contextlib import ExitStack
+
+    with ExitStack() as stack:
+        sources = [stack.enter_context(open(path, encoding='utf-8'))
+                   for path in args.merge_shards]
+        return merge_shard_outputs(sources, sys.stdout)
+
+
+def _process_packages(packages: Iterable[Tuple[str, list]],
+                      args: argparse.Namespace,
+                      stats: Optional[StageStats] = None) -> int:
+    """Записать разобранные пакеты в выбранный формат вывода."""
+    if args.convert:
+        with open(args.convert, 'wb') as output:
+            return write_packages_binary(packages, output)
+    if args.binary_output:
+        with open(args.binary_output, 'wb') as output:
+            return write_messages_binary(
+                (calculate_info(workout_type, data)
+                 for workout_type, data in packages),
+                output
+            )
+    if args.index:
+        with PackageIndex(args.index, args.index_capacity) as index:
+            count = _write_messages(
+                iter_deduplicated(packages, index, args.index_serve), args
+            )
+            print(f'Индекс: {len(index)} пакетов, новых отсеяно '
+                  f'фильтром {index.filtered}', file=sys.stderr)
+        return count
+    cache = InfoCache(args.cache_size) if args.cache_size else None
+    if args.numeric == 'decimal':
+        count = _write_messages(
+            (calculate_info(workout_type, data, 'decimal')
+             for workout_type, data in packages), args
+        )
+    elif args.output:
+        get_info = calculate_info if cache is None else cache.get_info
+        count = _write_messages((get_info(workout_type, data)
+                                 for workout_type, data in packages), args)
+    else:
+        count = process_stream(packages, sys.stdout, cache, stats)
+    if cache is not None:
+        print(f'Кэш: попаданий {cache.hits}, промахов {cache.misses}',
+              file=sys.stderr)
+    if stats is not None:
+        _write_stats(stats, args.stats)
+    return count
+
+
+def _write_messages(messages: Iterable[Any],
+                    args: argparse.Namespace) -> int:
+    """Записать сообщения в приёмник ``--output`` или в stdout."""
+    if args.output:
+        with open_sink(args.output, args.output_format,
+                       args.flush_size) as sink:
+            return sink.write_many(messages)
+    return render_messages(messages, sys.stdout)
+
+
+def _write_stats(stats: StageStats, path: str) -> None:
+    """Сохранить замеры: ``.prom`` - формат Prometheus, иначе JSON."""
+    import json
+
+    with open(path, 'w', encoding='utf-8') as output:
+        if path.endswith('.prom'):
+            output.write(stats.to_prometheus())
+        else:
+            json.dump(stats.snapshot(), output, indent=2)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='homework',
+        description='Обработка пакетов от датчиков фитнес-трекера.'
+    )
+    parser.add_argument(
+        '--input',
+        help='файл с пакетами JSON по одному на строку, "-" - stdin'
+    )
+    parser.add_argument(
+        '--input-format', choices=['json', 'binary'], default='json',
+        help='формат входа; двоичный читается только из файла'
+    )
+    parser.add_argument(
+        '--convert', metavar='OUT',
+        help='перевести вход JSON в двоичный файл пакетов OUT'
+    )
+    parser.add_argument(
+        '--binary-output', metavar='OUT',
+        help='записать результаты в двоичный файл OUT вместо stdout'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='количество процессов для обработки (по умолчанию 1)'
+    )
+    parser.add_argument(
+        '--cache-size', type=int, default=0,
+        help='размер LRU-кэша повторных пакетов (0 - без кэша)'
+    )
+    parser.add_argument(
+        '--output', metavar='PATH',
+        help='записать результаты в PATH ("-" - stdout) вместо печати; '
+             'формат по расширению: .csv, .jsonl, .db/.sqlite, иначе текст'
+    )
+    parser.add_argument(
+        '--output-format', choices=sorted(SINKS),
+        help='формат --output, если расширение не подходит'
+    )
+    parser.add_argument(
+        '--flush-size', type=int, metavar='N',
+        help='записывать --output блоками по N сообщений '
+             f'(по умолчанию {SINK_BATCH_SIZE}, для SQLite 10000)'
+    )
+    parser.add_argument(
+        '--shard', type=_shard_spec, metavar='I/N',
+        help='обработать только шард I из N (по CRC32 от user_id или '
+             'device_id), строки вывода с номером строки входа'
+    )
+    parser.add_argument(
+        '--shard-state', metavar='PATH',
+        help='с --shard: сохранить итоги по пользователям шарда в PATH'
+    )
+    parser.add_argument(
+        '--split', type=int, metavar='N',
+        help='разложить --input за один проход на N файлов шардов '
+             'INPUT.0 .. INPUT.N-1 для --shard'
+    )
+    parser.add_argument(
+        '--merge-shards', nargs='+', metavar='PATH',
+        help='слить выводы --shard в порядке исходных строк'
+    )
+    parser.add_argument(
+        '--numeric', choices=NUMERIC_MODES, default='float64',
+        help='арифметика расчёта: float64 (по умолчанию), float32 для '
+             'двоичного входа, decimal для сверок (см. README)'
+    )
+    parser.add_argument(
+        '--index', metavar='PATH',
+        help='индекс уже обработанных пакетов на диске: повторы '
+             'не пересчитываются (файл создаётся, если его нет)'
+    )
+    parser.add_argument(
+        '--index-capacity', type=int, default=INDEX_CAPACITY, metavar='N',
+        help='на сколько пакетов рассчитан новый индекс '
+             f'(по умолчанию {INDEX_CAPACITY})'
+    )
+    parser.add_argument(
+        '--index-serve', action='store_true',
+        help='выводить повторы из сохранённых результатов, '
+             'а не пропускать'
+    )
+    parser.add_argument(
+        '--rejects', metavar='PATH',
+        help='проверять пакеты блоками и писать отброшенные в PATH '
+             '(строки JSON с кодом причины)'
+    )
+    parser.add_argument(
+        '--stats', metavar='PATH',
+        help='замерить этапы обработки и сохранить в PATH '
+             '(.prom - формат Prometheus, иначе JSON)'
+    )
+    parser.add_argument(
+        '--profile', metavar='PATH',
+        help='запустить обработку под cProfile и сохранить pstats в PATH'
+    )
+    parser.add_argument(
+        '--serve', action='store_true',
+        help='запустить TCP-сервер вместо обработки файла'
+    )
+    parser.add_argument(
+        '--daemon', metavar='SOCKET',
+        help='запустить долгоживущий сервер на Unix-сокете SOCKET '
+             f'(кэш по умолчанию {DAEMON_CACHE_SIZE} пакетов)'
+    )
+    parser.add_argument(
+        '--client', metavar='SOCKET',
+        help='отправить пакеты из --input демону на SOCKET'
+    )
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='адрес сервера (по умолчанию 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='порт сервера (по умолчанию 8765)')
+    parser.add_argument('--format', choices=['text', 'json'],
+                        default='text', help='формат ответов сервера')
+    return parser
+
+
+def _process_binary(args: argparse.Namespace) -> int:
+    """Посчитать двоичный файл пакетов целиком через NumPy."""
+    records = map_packages_binary(args.input)
+    result = calculate_binary(args.input, args.numeric)
+    if args.binary_output:
+        with open(args.binary_output, 'wb') as output:
+            return write_results_binary(records['workout_type'],
+                                        records['duration'], result, output)
+    return _write_messages(
+        iter_batch_messages(records['workout_type'], records['duration'],
+                            result),
+        args
+    )
+
+
+def _client_args(argv: List[str]) -> Optional[Tuple[str, str]]:
+    """``(SOCKET, PATH)`` для ``--client SOCKET --input PATH``.
+
+    Тонкому клиенту argparse не нужен, а сборка полного парсера
+    стоит дольше самого обмена с демоном. Любые другие ключи - ``None``,
+    и строка разбирается обычным парсером.
+    """
+    options = dict(zip(argv[::2], argv[1::2]))
+    if len(argv) != 4 or set(options) != {'--client', '--input'}:
+        return None
+    return options['--client'], options['--input']
+
+
+def _send_input(path: str, input_path: str) -> int:
+    if input_path == '-':
+        return send_packages(path, sys.stdin, sys.stdout)
+    with open(input_path, encoding='utf-8') as lines:
+        return send_packages(path, lines, sys.stdout)
+
+
+def _report(count: int, start: float) -> None:
+    """Напечатать в stderr число пакетов и скорость обработки."""
+    sys.stdout.flush()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else 0.0
+    print(f'Обработано пакетов: {count} за {elapsed:.3f} с '
+          f'({rate:.0f} пакетов/с)', file=sys.stderr)
+
+
+def _process_input(args: argparse.Namespace) -> int:
+    if args.input_format == 'binary':
+        return _process_binary(args)
+    if args.client:
+        return _send_input(args.client, args.input)
+    if args.input == '-':
+        return _process_lines(sys.stdin, args)
+    with open(args.input, encoding='utf-8') as lines:
+        return _process_lines(lines, args)
+
+
+_OUTPUT_FLAGS = ('output', 'output_format', 'flush_size')
+# Режимы запуска в порядке выбора в cli: имя в сообщении и ключи, которые
+# в режиме что-то значат. Остальные ключи со значением не по умолчанию
+# отклоняются, а не пропускаются молча.
+_CLI_MODES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    'daemon': ('--daemon', ('daemon', 'format', 'cache_size')),
+    'serve': ('--serve', ('serve', 'host', 'port', 'format', 'cache_size')),
+    'merge_shards': ('--merge-shards', ('merge_shards',)),
+    'binary': ('--input-format binary',
+               ('input', 'input_format', 'numeric', 'binary_output',
+                'profile') + _OUTPUT_FLAGS),
+    'client': ('--client', ('input', 'client', 'profile')),
+    'split': ('--split', ('input', 'split', 'profile')),
+    'shard': ('--shard', ('input', 'shard', 'shard_state', 'profile')),
+    'workers': ('--workers N', ('input', 'workers', 'profile')),
+    'convert': ('--convert', ('input', 'convert', 'rejects', 'profile')),
+    'binary_output': ('--binary-output',
+                      ('input', 'binary_output', 'rejects', 'profile')),
+    'index': ('--index', ('input', 'index', 'index_capacity', 'index_serve',
+                          'rejects', 'profile') + _OUTPUT_FLAGS),
+    'decimal': ('--numeric decimal',
+                ('input', 'numeric', 'rejects', 'profile') + _OUTPUT_FLAGS),
+    'stream': ('обработки JSON', ('input', 'cache_size', 'stats', 'rejects',
+                                  'profile') + _OUTPUT_FLAGS),
+}
+
+
+def _cli_mode(args: argparse.Namespace) -> str:
+    """Режим запуска из ``_CLI_MODES``, в том же порядке, что в ``cli``."""
+    triggers = {
+        'daemon': args.daemon,
+        'serve': args.serve,
+        'merge_shards': args.merge_shards,
+        'binary': args.input_format == 'binary',
+        'client': args.client,
+        'split': args.split is not None,
+        'shard': args.shard,
+        'workers': args.workers > 1,
+        'convert': args.convert,
+        'binary_output': args.binary_output,
+        'index': args.index,
+        'decimal': args.numeric == 'decimal',
+    }
+    return next((mode for mode, on in triggers.items() if on), 'stream')
+
+
+def _check_args(parser: argparse.ArgumentParser,
+                args: argparse.Namespace) -> None:
+    """Отклонить ключи, которые в выбранном режиме не действуют."""
+    mode = _cli_mode(args)
+    title, allowed = _CLI_MODES[mode]
+    ignored = [f'--{name.replace("_", "-")}'
+               for name, value in vars(args).items()
+               if name not in allowed and value != parser.get_default(name)]
+    if ignored:
+        parser.error(f'в режиме {title} не действуют ключи: '
+                     f'{", ".join(ignored)}')
+    rules = [
+        ('input' in allowed and args.input is None,
+         'укажите --input, --serve, --daemon или --merge-shards'),
+        (mode == 'binary' and args.input == '-',
+         'двоичный вход читается только из файла --input'),
+        (mode == 'binary' and args.numeric == 'decimal',
+         '--numeric decimal работает только с пакетами JSON'),
+        (args.output and args.binary_output,
+         '--output несовместим с --binary-output'),
+        ((args.output_format or args.flush_size) and not args.output,
+         '--output-format и --flush-size работают только с --output'),
+        (args.cache_size and args.stats,
+         '--cache-size и --stats несовместимы'),
+        (args.stats and (args.rejects or args.output),
+         '--stats несовместим с --rejects и --output'),
+        (mode == 'split' and args.split < 1,
+         '--split N работает только с N > 0'),
+    ]
+    for failed, message in rules:
+        if failed:
+            parser.error(message)
+
+
+def cli(argv: Optional[List[str]] = None) -> int:
+    """Точка входа командной строки."""
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        for workout_type, data in DEMO_PACKAGES:
+            main(read_package(workout_type, data))
+        return 0
+    client = _client_args(argv)
+    if client is not None:
+        start = time.perf_counter()
+        _report(_send_input(*client), start)
+        return 0
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    _check_args(parser, args)
+    if args.serve or args.daemon:
+        import asyncio
+
+        asyncio.run(_serve_forever(args))
+        return 0
+
+    start = time.perf_counter()
+    if args.merge_shards:
+        count = _merge_shards(args)
+    elif args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        count = profiler.runcall(_process_input, args)
+        profiler.dump_stats(args.profile)
+    else:
+        count = _process_input(args)
+    _report(count, start)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
@@ -1,6 +1,7 @@
 import re
 import pytest
 import types
+from io import BytesIO, StringIO
 import inspect
 from conftest import Capturing
 
@@ -363,3 +364,1021 @@ def test_main_output(input_data, expected):
     assert get_message_output == expected, (
         'Метод `main` должен печатать результат в консоль.\n'
     )
+
+
+@pytest.mark.parametrize('packages', [
+    [('SWM', [720, 1, 80, 25, 40]),
+     ('RUN', [15000, 1, 75]),
+     ('WLK', [9000, 1, 75, 180])],
+    [('RUN', [420, 4, 20]),
+     ('RUN', [1206, 12, 6]),
+     ('WLK', [420, 4, 20, 42]),
+     ('SWM', [1206, 12, 6, 12, 6])],
+])
+def test_calculate_batch(packages):
+    pytest.importorskip('numpy')
+    columns = {'action': [], 'duration': [], 'weight': [],
+               'height': [], 'length_pool': [], 'count_pool': []}
+    for workout_type, data in packages:
+        training_class = homework.TYPES_OF_TRAINING[workout_type]
+        row = dict.fromkeys(columns, 0.0)
+        row.update(zip(inspect.signature(training_class).parameters, data))
+        for name, value in row.items():
+            columns[name].append(value)
+    result = homework.calculate_batch(
+        [workout_type for workout_type, _ in packages], **columns
+    )
+    for i, (workout_type, data) in enumerate(packages):
+        training = homework.read_package(workout_type, data)
+        assert result['distance'][i] == pytest.approx(
+            training.get_distance()
+        ), 'Дистанция в `calculate_batch` не совпадает со скалярной.'
+        assert result['speed'][i] == pytest.approx(
+            training.get_mean_speed()
+        ), 'Скорость в `calculate_batch` не совпадает со скалярной.'
+        assert result['calories'][i] == pytest.approx(
+            training.get_spent_calories()
+        ), 'Калории в `calculate_batch` не совпадают со скалярными.'
+
+
+def test_calculate_batch_unknown_type():
+    pytest.importorskip('numpy')
+    with pytest.raises(homework.UnknownWorkoutType):
+        homework.calculate_batch(['XXX'], [1], [1], [1])
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('["RUN", [15000, 1, 75]]', ('RUN', [15000, 1, 75])),
+    ('{"workout_type": "WLK", "data": [9000, 1, 75, 180]}',
+     ('WLK', [9000, 1, 75, 180])),
+])
+def test_parse_package(line, expected):
+    assert tuple(homework.parse_package(line)) == expected, (
+        'Функция `parse_package` должна возвращать код и данные пакета.'
+    )
+
+
+def test_process_stream():
+    lines = iter([
+        '["SWM", [720, 1, 80, 25, 40]]\n',
+        '\n',
+        '["WLK", [9000, 1, 75, 180]]\n',
+    ])
+    output = StringIO()
+    count = homework.process_stream(homework.iter_packages(lines), output)
+    assert count == 2, 'Пустые строки не должны считаться пакетами.'
+    assert output.getvalue().splitlines() == [
+        homework.read_package('SWM', [720, 1, 80, 25, 40])
+        .show_training_info().get_message(),
+        homework.read_package('WLK', [9000, 1, 75, 180])
+        .show_training_info().get_message(),
+    ], 'Функция `process_stream` должна писать сообщения построчно.'
+
+
+def test_iter_packages_bad_line():
+    with pytest.raises(ValueError, match='Строка 2'):
+        list(homework.iter_packages(['["RUN", [1, 1, 1]]', '{oops']))
+
+
+def test_process_stream_parallel():
+    lines = [
+        '["SWM", [720, 1, 80, 25, 40]]\n',
+        '["RUN", [15000, 1, 75]]\n',
+        '["WLK", [9000, 1, 75, 180]]\n',
+    ] * 5
+    expected = StringIO()
+    homework.process_stream(homework.iter_packages(lines), expected)
+    output = StringIO()
+    count = homework.process_stream_parallel(lines, output, workers=2,
+                                             chunk_size=4)
+    assert count == len(lines)
+    assert output.getvalue() == expected.getvalue(), (
+        'Параллельная обработка должна сохранять порядок пакетов.'
+    )
+
+
+@pytest.mark.parametrize('workout_type, data', [
+    ('SWM', [720, 1, 80, 25, 40]),
+    ('RUN', [15000, 1, 75]),
+    ('WLK', [9000, 1, 75, 180]),
+])
+def test_compact_class(workout_type, data):
+    training_class = homework.TYPES_OF_TRAINING[workout_type]
+    compact = homework.compact_class(training_class)(*data)
+    assert not hasattr(compact, '__dict__'), (
+        'Компактный вариант тренировки не должен иметь `__dict__`.'
+    )
+    expected = training_class(*data).show_training_info()
+    result = compact.show_training_info()
+    assert not hasattr(result, '__dict__')
+    assert result.get_message() == expected.get_message()
+    assert result.calories == expected.calories
+
+
+def test_TrainingBatch():
+    batch = homework.TrainingBatch(homework.DEMO_PACKAGES)
+    assert len(batch) == len(homework.DEMO_PACKAGES)
+    for i, (workout_type, data) in enumerate(homework.DEMO_PACKAGES):
+        expected = homework.read_package(workout_type, data)
+        assert (batch[i].show_training_info()
+                == expected.show_training_info())
+    with pytest.raises(TypeError):
+        batch.append('RUN', [1, 1])
+    pytest.importorskip('numpy')
+    result = batch.calculate()
+    assert list(result['calories']) == pytest.approx(
+        [homework.read_package(*package).get_spent_calories()
+         for package in homework.DEMO_PACKAGES]
+    )
+
+
+def test_render_messages():
+    messages = [
+        homework.InfoMessage('Swimming', 1, 75, 1, 80),
+        homework.CompactInfoMessage('Running', 4, 20, 4, 20.12345),
+        homework.InfoMessage('SportsWalking', 12, 6, 12, 6),
+    ]
+    output = StringIO()
+    count = homework.render_messages(messages, output, buffer_size=2)
+    assert count == len(messages)
+    assert output.getvalue() == ''.join(
+        message.get_message() + '\n' for message in messages
+    ), 'Функция `render_messages` должна выводить то же, что `get_message`.'
+
+
+def test_register_training_type():
+    class Rowing(homework.Training, code='ROW'):
+        LEN_STEP = 2.5
+
+        def get_spent_calories(self):
+            return self.get_mean_speed() * self.weight
+
+    try:
+        assert homework.TYPES_OF_TRAINING['ROW'] is Rowing, (
+            'Наследник `Training` с `code` должен попадать в реестр.'
+        )
+        assert Rowing.WORKOUT_CODE == 'ROW'
+        training = homework.read_package('ROW', [1000, 2, 80])
+        assert isinstance(training, Rowing)
+        assert training.get_spent_calories() == 1000 * 2.5 / 1000 / 2 * 80
+        with pytest.raises(ValueError):
+            class Duplicate(homework.Training, code='ROW'):
+                pass
+    finally:
+        homework.TYPES_OF_TRAINING.pop('ROW', None)
+
+
+def test_read_package_unknown_type():
+    with pytest.raises(homework.UnknownWorkoutType):
+        homework.read_package('XXX', [1, 1, 1])
+
+
+def test_InfoCache():
+    cache = homework.InfoCache(maxsize=2)
+    first = cache.get_info('RUN', [15000, 1, 75])
+    assert cache.get_info('RUN', [15000, 1, 75]) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert first == homework.read_package(
+        'RUN', [15000, 1, 75]).show_training_info()
+    cache.get_info('WLK', [9000, 1, 75, 180])
+    cache.get_info('SWM', [720, 1, 80, 25, 40])
+    assert len(cache) == 2, 'Кэш не должен превышать `maxsize`.'
+    cache.get_info('RUN', [15000, 1, 75])
+    assert cache.misses == 4, 'Старые записи должны вытесняться.'
+
+
+def test_show_training_info_computes_once(monkeypatch):
+    calls = []
+    for name in ('get_distance', '_mean_speed'):
+        method = getattr(homework.Training, name)
+
+        def counting(self, *args, name=name, method=method):
+            calls.append(name)
+            return method(self, *args)
+        monkeypatch.setattr(homework.Training, name, counting)
+    training = homework.Running(15000, 1, 75)
+    info = training.show_training_info()
+    assert calls == ['get_distance', '_mean_speed'], (
+        '`show_training_info` должен считать дистанцию и скорость '
+        'по одному разу.'
+    )
+    assert info.distance == training.get_distance()
+    assert info.speed == training.get_mean_speed()
+    assert info.calories == training.get_spent_calories()
+    training.action = 9000
+    assert training.get_distance() == 5.85, (
+        'Значения не должны кэшироваться между вызовами.'
+    )
+
+
+@pytest.mark.parametrize('response_format', ['text', 'json'])
+def test_start_server(response_format):
+    import asyncio
+    import json
+
+    async def exchange():
+        server = await homework.start_server('127.0.0.1', 0,
+                                             response_format)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                           port)
+            writer.write(b'["RUN", [15000, 1, 75]]\n\n["XXX", [1]]\n'
+                         b'["RUN", [1' + b'0' * 400 + b', 1, 1]]\n'
+                         b'["WLK", [9000, 1, 75, 180]]')
+            writer.write_eof()
+            answer = await reader.read()
+            writer.close()
+        return answer.decode('utf-8').splitlines()
+
+    lines = asyncio.run(exchange())
+    assert len(lines) == 4, 'Сервер должен отвечать строкой на пакет.'
+    expected = homework.read_package(
+        'RUN', [15000, 1, 75]).show_training_info()
+    if response_format == 'json':
+        assert json.loads(lines[0]) == homework.info_to_dict(expected)
+        assert 'UnknownWorkoutType' in json.loads(lines[1])['error']
+        assert 'OverflowError' in json.loads(lines[2])['error']
+        assert json.loads(lines[3])['training_type'] == 'SportsWalking'
+    else:
+        assert lines[0] == expected.get_message()
+        assert lines[1].startswith('Ошибка: UnknownWorkoutType')
+        assert lines[2].startswith('Ошибка: OverflowError')
+        assert lines[3].startswith('Тип тренировки: SportsWalking')
+
+
+def test_binary_packages_roundtrip(tmp_path):
+    pytest.importorskip('numpy')
+    path = tmp_path / 'packages.bin'
+    with open(path, 'wb') as output:
+        count = homework.convert_to_binary(
+            [f'["{code}", {data}]' for code, data in homework.DEMO_PACKAGES],
+            output
+        )
+    assert count == len(homework.DEMO_PACKAGES)
+    records = homework.map_packages_binary(str(path))
+    assert records['workout_type'].tolist() == [
+        code.encode() for code, _ in homework.DEMO_PACKAGES
+    ]
+    result = homework.calculate_binary(str(path))
+    expected = [homework.read_package(*package).show_training_info()
+                for package in homework.DEMO_PACKAGES]
+    messages = list(homework.iter_batch_messages(
+        records['workout_type'], records['duration'], result
+    ))
+    assert [message.get_message() for message in messages] == [
+        message.get_message() for message in expected
+    ]
+
+    results_path = tmp_path / 'results.bin'
+    with open(results_path, 'wb') as output:
+        homework.write_messages_binary(expected, output)
+    assert list(homework.iter_results_binary(str(results_path))) == expected
+
+
+@pytest.mark.parametrize('options', [
+    ['--convert', 'out.bin', '--workers', '2'],
+    ['--binary-output', 'out.bin', '--workers', '2'],
+    ['--convert', 'out.bin', '--stats', 'stats.json'],
+    ['--binary-output', 'out.bin', '--stats', 'stats.json'],
+    ['--input-format', 'binary', '--rejects', 'rejects.txt'],
+    ['--input-format', 'binary', '--stats', 'stats.json'],
+    ['--client', '--stats', 'stats.json'],
+    ['--serve', '--stats', 'stats.json'],
+    ['--daemon', '--stats', 'stats.json'],
+    ['--input-format', 'binary', '--convert', 'out.bin'],
+    ['--input-format', 'binary', '--workers', '2'],
+    ['--input-format', 'binary', '--cache-size', '10'],
+    ['--numeric', 'float32'],
+    ['--index-serve'],
+    ['--flush-size', '10'],
+    ['--port', '9000'],
+    ['--shard-state', 'state.json'],
+    ['--merge-shards', 'a.out', '--profile', 'run.prof'],
+])
+def test_cli_incompatible_options(options, tmp_path, capsys):
+    source = tmp_path / 'packages.jsonl'
+    source.write_text('["RUN", [15000, 1, 75]]\n')
+    with pytest.raises(SystemExit):
+        homework.cli(['--input', str(source)]
+                     + [str(tmp_path / option) if '.' in option
+                        else option for option in options])
+    assert [path.name for path in tmp_path.iterdir()] == ['packages.jsonl'], (
+        'Файлы не должны создаваться.'
+    )
+
+
+def test_binary_bad_file(tmp_path):
+    pytest.importorskip('numpy')
+    path = tmp_path / 'bad.bin'
+    path.write_bytes(b'not a package file')
+    with pytest.raises(ValueError):
+        homework.map_packages_binary(str(path))
+
+
+def test_binary_fields_too_long(tmp_path):
+    class RowingErgometerRace(homework.Training, code='ROWG2'):
+        def get_spent_calories(self):
+            return self.get_mean_speed() * self.weight
+
+    try:
+        with pytest.raises(ValueError):
+            homework.write_packages_binary([('ROWG2', [1000, 1, 80])],
+                                           BytesIO())
+        message = homework.read_package(
+            'ROWG2', [1000, 1, 80]).show_training_info()
+        with pytest.raises(ValueError):
+            homework.write_messages_binary([message], BytesIO())
+        with homework.PackageIndex(str(tmp_path / 'index'), 100) as index:
+            with pytest.raises(ValueError):
+                index.get_or_add('ROWG2', [1000, 1, 80])
+            assert index.get('ROWG2', [1000, 1, 80]) is None
+    finally:
+        homework.TYPES_OF_TRAINING.pop('ROWG2', None)
+
+
+def test_TrainingAggregator(tmp_path):
+    run = homework.read_package('RUN', [15000, 1, 75]).show_training_info()
+    walk = homework.read_package(
+        'WLK', [9000, 1, 75, 180]).show_training_info()
+    day = 24 * 3600
+    aggregator = homework.TrainingAggregator(window=7 * day, slices=7)
+    aggregator.add('alice', 0, run)
+    aggregator.add('alice', 3 * day, walk)
+    aggregator.add('bob', 3 * day, run)
+    totals = aggregator.totals('alice')
+    assert totals.count == 2
+    assert totals.distance == run.distance + walk.distance
+    assert totals.mean_calories == (run.calories + walk.calories) / 2
+    assert aggregator.totals('alice', training_type='Running').count == 1
+    assert set(aggregator.by_type('alice')) == {'Running', 'SportsWalking'}
+
+    aggregator.add('alice', 8 * day, run)
+    assert aggregator.totals('alice').count == 2, (
+        'Первый день должен выпасть из скользящего окна.'
+    )
+    aggregator.add('alice', 0, run)
+    assert aggregator.dropped == 1
+
+    path = str(tmp_path / 'state.json')
+    aggregator.checkpoint(path)
+    restored = homework.TrainingAggregator.restore(path)
+    assert restored.to_state() == aggregator.to_state()
+    assert restored.totals('bob') == aggregator.totals('bob')
+
+
+def test_TrainingAggregator_tumbling():
+    run = homework.read_package('RUN', [15000, 1, 75]).show_training_info()
+    aggregator = homework.TrainingAggregator(window=100)
+    aggregator.add(1, 10, run)
+    aggregator.add(1, 99, run)
+    aggregator.add(1, 100, run)
+    assert aggregator.totals(1).count == 1
+    assert aggregator.totals(1, now=50).count == 0, (
+        'Прошлое окно уже удалено.'
+    )
+
+
+def test_StageStats():
+    class Rowing(homework.Training, code='ROW'):
+        def get_spent_calories(self):
+            return self.weight * self.duration
+
+    lines = [f'["{code}", {data}]\n' for code, data in homework.DEMO_PACKAGES]
+    lines.append('["ROW", [6000, 1, 80]]\n')
+    try:
+        expected = StringIO()
+        homework.process_stream(homework.iter_packages(lines), expected)
+        stats = homework.StageStats()
+        output = StringIO()
+        count = homework.process_stream(
+            homework.iter_packages(lines, stats=stats), output, stats=stats
+        )
+    finally:
+        homework.TYPES_OF_TRAINING.pop('ROW', None)
+    assert count == len(lines)
+    assert output.getvalue() == expected.getvalue(), (
+        'Замеры не должны менять вывод.'
+    )
+    snapshot = stats.snapshot()
+    assert set(snapshot) == set(homework.StageStats.STAGES)
+    assert snapshot['calculate']['RUN']['calls'] == 1
+    for stage in ('distance', 'speed', 'calories'):
+        assert set(snapshot[stage]) == {'ROW'}, (
+            'Без ядра дистанция, скорость и калории замеряются отдельно.'
+        )
+    prometheus = stats.to_prometheus()
+    assert ('homework_stage_calls_total{stage="parse",workout_type="SWM"} 1'
+            in prometheus.splitlines())
+    assert '# TYPE homework_stage_seconds_total counter' in prometheus
+
+
+@pytest.mark.parametrize('package, expected', [
+    (['RUN', [15000, 1, 75]], None),
+    ({'workout_type': 'WLK', 'data': [9000, 1, 75, 180]}, None),
+    (['RUN', [15000, 0, 75]], 'duration_out_of_range'),
+    (['WLK', [9000, 1, 75, 0]], 'height_out_of_range'),
+    (['SWM', [720, 1, -80, 25, 40]], 'weight_out_of_range'),
+    (['SWM', [720, 1, 80, 25, float('inf')]], 'not_finite'),
+    (['RUN', [15000, '1', 75]], 'not_numeric'),
+    (['RUN', [1, [2], 3]], 'not_numeric'),
+    (['RUN', [10**400, 1, 3]], 'not_numeric'),
+    (['RUN', [True, 1, 75]], 'not_numeric'),
+    (['RUN', [15000, 1]], 'bad_arity'),
+    (['XXX', [1, 1, 1]], 'unknown_type'),
+    ('RUN', 'bad_structure'),
+])
+def test_validate_packages(package, expected):
+    pytest.importorskip('numpy')
+    reasons = homework.validate_packages(
+        [['RUN', [1, 1, 1]], package, ['WLK', [1, 1, 1, 1]]]
+    )
+    assert reasons == [None, expected, None], (
+        'Функция `validate_packages` должна возвращать код причины отказа.'
+    )
+    assert homework.validate_packages([package]) == [expected], (
+        'Вердикт пакета не должен зависеть от соседних пакетов.'
+    )
+
+
+def test_iter_valid_packages():
+    pytest.importorskip('numpy')
+    import json
+    lines = [
+        '["RUN", [15000, 1, 75]]\n',
+        '{oops\n',
+        '\n',
+        '["RUN", [15000, 0, 75]]\n',
+        '["WLK", [9000, 1, 75, 180]]\n',
+    ]
+    rejects = StringIO()
+    packages = list(homework.iter_valid_packages(lines, rejects,
+                                                 chunk_size=2))
+    assert packages == [('RUN', [15000, 1, 75]),
+                        ('WLK', [9000, 1, 75, 180])]
+    assert [json.loads(line) for line in rejects.getvalue().splitlines()] == [
+        {'line': 2, 'reason': 'bad_json', 'package': '{oops'},
+        {'line': 4, 'reason': 'duration_out_of_range',
+         'package': '["RUN", [15000, 0, 75]]'},
+    ]
+
+
+def test_import_is_lazy():
+    import os
+    import subprocess
+    import sys
+    code = ('import sys, homework; '
+            'homework.read_package("RUN", [15000, 1, 75])'
+            '.show_training_info().get_message(); '
+            'print(" ".join(sorted(sys.modules)))')
+    result = subprocess.run([sys.executable, '-c', code],
+                            cwd=os.path.dirname(os.path.abspath(homework.__file__)),
+                            capture_output=True, text=True, check=True)
+    loaded = set(result.stdout.split())
+    for module in ['json', 'argparse', 'dataclasses', 'inspect', 'typing',
+                   'asyncio', 'numpy']:
+        assert module not in loaded, (
+            f'Скалярный путь не должен импортировать `{module}`.'
+        )
+
+
+def test_daemon_and_client(tmp_path):
+    import asyncio
+    import threading
+    path = str(tmp_path / 'homework.sock')
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    async def serve():
+        server = await homework.start_daemon(path,
+                                             cache=homework.InfoCache())
+        ready.set()
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    task = loop.create_task(serve())
+    thread = threading.Thread(target=loop.run_until_complete, args=(task,))
+    thread.start()
+    try:
+        assert ready.wait(5)
+        lines = [f'["{code}", {data}]\n'
+                 for code, data in homework.DEMO_PACKAGES] * 3
+        output = StringIO()
+        count = homework.send_packages(path, lines, output, batch_size=4)
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join(5)
+        loop.close()
+    assert count == len(lines)
+    expected = StringIO()
+    homework.process_stream(homework.iter_packages(lines), expected)
+    assert output.getvalue() == expected.getvalue(), (
+        'Ответы демона должны совпадать с обычной обработкой.'
+    )
+
+
+def test_client_daemon_closed(tmp_path):
+    import socket
+    import threading
+    path = str(tmp_path / 'homework.sock')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+
+    def close_after_first_line():
+        connection, _ = server.accept()
+        with connection:
+            connection.recv(64)
+            connection.sendall(b'first answer\n')
+
+    thread = threading.Thread(target=close_after_first_line)
+    thread.start()
+    try:
+        with pytest.raises(ConnectionError):
+            homework.send_packages(path, ['["RUN", [15000, 1, 75]]\n'] * 2,
+                                   StringIO())
+    finally:
+        thread.join(5)
+        server.close()
+
+
+def test_client_skips_argparse(tmp_path):
+    import os
+    import subprocess
+    import sys
+
+    code = ('import sys, homework\n'
+            'try:\n'
+            f'    homework.cli(["--client", {str(tmp_path / "no.sock")!r},'
+            ' "--input", "-"])\n'
+            'except OSError:\n'
+            '    pass\n'
+            'print("argparse" in sys.modules)')
+    result = subprocess.run([sys.executable, '-c', code],
+                            cwd=os.path.dirname(os.path.abspath(homework.__file__)),
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False', (
+        '`--client` не должен собирать парсер argparse.'
+    )
+
+
+def test_fused_kernel():
+    import random
+    rng = random.Random(16)
+    for workout_type, training_class in homework.TYPES_OF_TRAINING.items():
+        kernel = homework.fused_kernel(training_class)
+        assert kernel is not None
+        for _ in range(200):
+            data = [rng.randint(1, 20000), rng.uniform(0.1, 5),
+                    rng.uniform(40, 120), rng.uniform(150, 200),
+                    rng.randint(10, 50)][:len(
+                        homework._training_params(training_class))]
+            training = training_class(*data)
+            assert kernel(*data) == (training.get_distance(),
+                                     training.get_mean_speed(),
+                                     training.get_spent_calories()), (
+                'Ядро должно совпадать с методами класса до бита.'
+            )
+            assert (homework.calculate_info(workout_type, data)
+                    == training.show_training_info())
+
+
+def test_fused_kernel_subclass():
+    class LongSwimming(homework.Swimming):
+        LEN_STEP = 2.0
+        COEFF_ACTIVITY = 3
+
+    class CustomRunning(homework.Running):
+        def get_spent_calories(self):
+            return 0.0
+
+    class UphillRunning(homework.Running):
+        COEFF_INCLINE = 1.5
+
+        def _spent_calories(self, pace):
+            flat = super()._spent_calories(pace)
+            return flat * self.COEFF_INCLINE
+
+    class CappedRunning(homework.Running):
+        def _spent_calories(self, speed):
+            calories = (self.COEFF_CALORIE_BURN * speed
+                        - self.COEFF_CALORIE_RECREATION) * self.weight
+            return min(calories, 1000.0)
+
+    class SteepRunning(homework.Running):
+        def _spent_calories(self, pace):
+            climb = pace * self.weight / self.M_IN_KM
+            return climb * self.duration - self.COEFF_CALORIE_RECREATION
+
+    class Trail(homework.Running, code='TRL'):
+        def show_training_info(self):
+            info = super().show_training_info()
+            info.training_type = 'TrailRun'
+            return info
+
+    class Rowing(homework.Training, code='ROW'):
+        def __init__(self, action, duration, weight):
+            super().__init__(action, duration / 60, weight)
+
+        def _spent_calories(self, speed):
+            return speed * self.weight * self.duration
+
+    class Hike(homework.Running):
+        def __init__(self, action, duration, weight, pack):
+            super().__init__(action, duration, weight + pack)
+
+    class Swapped(homework.Running):
+        def __init__(self, duration, action, weight):
+            super().__init__(action, duration, weight)
+
+    try:
+        assert homework.fused_kernel(Rowing) is None, (
+            'Ядро не строится, если `__init__` преобразует аргументы.'
+        )
+        assert (homework.calculate_info('ROW', [6000, 90, 80])
+                == homework.read_package('ROW', [6000, 90, 80])
+                .show_training_info())
+    finally:
+        homework.TYPES_OF_TRAINING.pop('ROW', None)
+    assert homework.fused_kernel(Hike) is None, (
+        'Ядро не строится, если `__init__` не только сохраняет аргументы.'
+    )
+    training = Swapped(1, 15000, 75)
+    assert homework.fused_kernel(Swapped)(1, 15000, 75) == (
+        training.get_distance(), training.get_mean_speed(),
+        training.get_spent_calories()
+    ), 'Параметры передаются в ядро по именам, а не по позициям.'
+
+    data = [720, 1, 80, 25, 40]
+    training = LongSwimming(*data)
+    assert homework.fused_kernel(LongSwimming)(*data) == (
+        training.get_distance(), training.get_mean_speed(),
+        training.get_spent_calories()
+    ), 'Ядро должно брать переопределённые константы наследника.'
+    assert homework.fused_kernel(CustomRunning) is None, (
+        'Если переопределён `get_spent_calories`, ядро не строится.'
+    )
+    for training_class in (UphillRunning, CappedRunning):
+        assert homework.fused_kernel(training_class) is None, (
+            'Метод, не сводящийся к формуле, считается через методы.'
+        )
+    training = SteepRunning(15000, 1, 75)
+    assert homework.fused_kernel(SteepRunning)(15000, 1, 75) == (
+        training.get_distance(), training.get_mean_speed(),
+        training.get_spent_calories()
+    ), 'Ядро должно собираться из переопределённого метода.'
+    try:
+        assert homework.fused_kernel(Trail) is None, (
+            'Своё `show_training_info` ядро не повторит.'
+        )
+        assert (homework.calculate_info('TRL', [15000, 1, 75])
+                == homework.read_package('TRL', [15000, 1, 75])
+                .show_training_info())
+    finally:
+        homework.TYPES_OF_TRAINING.pop('TRL', None)
+    with pytest.raises(homework.UnknownWorkoutType):
+        homework.calculate_info('XXX', [1, 1, 1])
+
+
+def test_TrainingSession():
+    session = homework.TrainingSession('SWM', sample_seconds=60,
+                                       report_seconds=600,
+                                       weight=80, length_pool=25)
+    chunks = [{'action': [30] * 7, 'count_pool': [1] * 7,
+               'heart_rate': [120] * 7} for _ in range(4)]
+    messages = list(homework.iter_session_messages(session, chunks))
+    assert [message.duration for message in messages] == [
+        10 * 60 / 3600, 20 * 60 / 3600, 28 * 60 / 3600
+    ], 'Промежуточные сообщения должны идти на границах интервалов.'
+    assert messages[-1] == homework.read_package(
+        'SWM', [840, 28 * 60 / 3600, 80, 25, 28]).show_training_info()
+    assert messages[0] == homework.read_package(
+        'SWM', [300, 10 * 60 / 3600, 80, 25, 10]).show_training_info()
+    assert session.mean_heart_rate == 120
+    with pytest.raises(ValueError):
+        session.update([1, 2], count_pool=[1])
+    with pytest.raises(TypeError):
+        session.update([1, 2])
+    with pytest.raises(TypeError):
+        homework.TrainingSession('RUN', height=180)
+
+
+def test_TrainingSession_numpy():
+    np = pytest.importorskip('numpy')
+    session = homework.TrainingSession('WLK', weight=75, height=180)
+    for _ in range(3):
+        session.update(np.full(1200, 2))
+    assert session.info() == homework.read_package(
+        'WLK', [7200, 3600 / 3600, 75, 180]).show_training_info()
+
+
+@pytest.mark.parametrize('name', ['out.txt', 'out.csv', 'out.jsonl',
+                                  'out.db'])
+def test_result_sinks(tmp_path, name):
+    import csv
+    import json
+    import sqlite3
+
+    messages = [homework.calculate_info(workout_type, data)
+                for workout_type, data in homework.DEMO_PACKAGES]
+    path = str(tmp_path / name)
+    with homework.open_sink(path, batch_size=2) as sink:
+        assert sink.write_many(messages[:2]) == 2
+        assert sink.count == 2, 'Полный блок должен записываться сразу.'
+        homework.main(homework.read_package(*homework.DEMO_PACKAGES[2]),
+                      sink)
+        assert sink.count == 2
+    assert sink.count == 3, 'Остаток должен записываться при закрытии.'
+    if name.endswith('.db'):
+        connection = sqlite3.connect(path)
+        rows = connection.execute('SELECT * FROM training_results').fetchall()
+        connection.close()
+    elif name.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as file:
+            rows = list(csv.reader(file))
+        assert rows.pop(0) == list(homework.InfoMessage.FIELDS)
+        rows = [(row[0], *map(float, row[1:])) for row in rows]
+    elif name.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as file:
+            rows = [tuple(json.loads(line).values()) for line in file]
+    else:
+        with open(path, encoding='utf-8') as file:
+            assert file.read().splitlines() == [
+                message.get_message() for message in messages]
+        return
+    assert rows == [message._astuple() for message in messages], (
+        'Приёмник должен сохранять поля сообщения без потери точности.'
+    )
+
+
+def test_cli_output(tmp_path):
+    import sqlite3
+
+    source = tmp_path / 'packages.jsonl'
+    source.write_text('["RUN", [15000, 1, 75]]\n["WLK", [9000, 1, 75, 180]]\n')
+    database = str(tmp_path / 'results.db')
+    assert homework.cli(['--input', str(source), '--output', database,
+                         '--flush-size', '1']) == 0
+    connection = sqlite3.connect(database)
+    count, = connection.execute(
+        'SELECT count(*) FROM training_results').fetchone()
+    connection.close()
+    assert count == 2
+
+
+def make_shard_lines(count):
+    import json
+    import random
+
+    rng = random.Random(19)
+    lines = []
+    for number in range(count):
+        workout_type, data = rng.choice(homework.DEMO_PACKAGES)
+        data = [value * rng.uniform(0.5, 2) for value in data]
+        lines.append(json.dumps({
+            'user_id': f'user-{rng.randrange(20)}',
+            'timestamp': number * 600 - rng.randrange(3) * 86400,
+            'workout_type': workout_type, 'data': data,
+        }) + '\n')
+    return lines
+
+
+def test_shard_of_is_stable():
+    assert homework.shard_of('user-1', 8) == 4, (
+        'Номер шарда не должен зависеть от запуска и машины.'
+    )
+    assert {homework.shard_of(f'user-{i}', 4) for i in range(100)} == {
+        0, 1, 2, 3}
+
+
+def test_process_shard_matches_single_node():
+    import json
+
+    lines = make_shard_lines(500)
+    single = StringIO()
+    single_aggregator = homework.TrainingAggregator(86400, 2)
+    homework.process_shard(lines, 0, 1, single, single_aggregator)
+    outputs = []
+    merged_aggregator = None
+    for shard in range(3):
+        output = StringIO()
+        aggregator = homework.TrainingAggregator(86400, 2)
+        homework.process_shard(lines, shard, 3, output, aggregator)
+        outputs.append(output.getvalue().splitlines(keepends=True))
+        if merged_aggregator is None:
+            merged_aggregator = aggregator
+        else:
+            merged_aggregator.merge(aggregator)
+    merged = StringIO()
+    homework.merge_shard_outputs(outputs, merged)
+    expected = StringIO()
+    homework.process_stream(
+        ((record['workout_type'], record['data'])
+         for record in map(json.loads, lines)), expected)
+    assert merged.getvalue() == expected.getvalue(), (
+        'Слитый вывод шардов должен совпадать с выводом одного узла.'
+    )
+    assert single_aggregator.dropped > 0
+    assert merged_aggregator.dropped <= single_aggregator.dropped
+    assert merged_aggregator.latest == single_aggregator.latest
+    for user in range(20):
+        assert (merged_aggregator.by_type(f'user-{user}')
+                == single_aggregator.by_type(f'user-{user}'))
+
+
+def test_split_shards():
+    lines = make_shard_lines(300)
+    parts = [StringIO() for _ in range(3)]
+    counts = homework.split_shards(lines, parts)
+    assert sum(counts) == len(lines)
+    for shard, part in enumerate(parts):
+        split_output = StringIO()
+        split_aggregator = homework.TrainingAggregator(86400, 2)
+        homework.process_shard(part.getvalue().splitlines(keepends=True),
+                               shard, 3, split_output, split_aggregator)
+        output = StringIO()
+        aggregator = homework.TrainingAggregator(86400, 2)
+        homework.process_shard(lines, shard, 3, output, aggregator)
+        assert split_output.getvalue() == output.getvalue(), (
+            'Файл шарда должен давать тот же вывод, что и общий вход.'
+        )
+        assert split_aggregator.to_state() == aggregator.to_state()
+
+
+@pytest.mark.parametrize('line', [
+    '12 {"user_id": 1, "workout_type": "RUN", "data": [1, 1, 1]}\n',
+    '1x\t{"user_id": 1, "workout_type": "RUN", "data": [1, 1, 1]}\n',
+    '{"user_id": 1, "workout_type": "RUN", "data": [1, 1, 1], '
+    '"timestamp": "noon"}\n',
+    '{"user_id": 1, "workout_type": "RUN", "data": [1, 1, 1], '
+    '"timestamp": NaN}\n',
+])
+def test_process_shard_bad_line(line):
+    lines = ['{"user_id": 1, "workout_type": "RUN", "data": [1, 1, 1]}\n',
+             line]
+    with pytest.raises(ValueError, match='^Строка 2: '):
+        homework.process_shard(lines, 0, 1, StringIO(),
+                               homework.TrainingAggregator())
+
+
+def test_cli_shards_in_processes(tmp_path):
+    import subprocess
+    import sys
+
+    source = tmp_path / 'packages.jsonl'
+    source.write_text(''.join(make_shard_lines(200)))
+    script = str(homework.__file__)
+    subprocess.run([sys.executable, script, '--input', str(source),
+                    '--split', '3'], capture_output=True, check=True)
+    processes = []
+    for shard in range(3):
+        with open(tmp_path / f'out{shard}.txt', 'w') as output:
+            processes.append(subprocess.Popen(
+                [sys.executable, script,
+                 '--input', f'{source}.{shard}', '--shard', f'{shard}/3',
+                 '--shard-state', str(tmp_path / f'state{shard}.json')],
+                stdout=output, stderr=subprocess.DEVNULL,
+            ))
+    assert [process.wait() for process in processes] == [0, 0, 0], (
+        'Шарды должны работать отдельными процессами.'
+    )
+    merged = subprocess.run(
+        [sys.executable, script, '--merge-shards',
+         *(str(tmp_path / f'out{shard}.txt') for shard in range(3))],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    single = subprocess.run(
+        [sys.executable, script, '--input', str(source), '--shard', '0/1',
+         '--shard-state', str(tmp_path / 'single.json')],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    assert merged == ''.join(line.split('\t', 1)[1]
+                             for line in single.splitlines(keepends=True))
+    state = homework.merge_shard_states(
+        str(tmp_path / f'state{shard}.json') for shard in range(3))
+    expected = homework.TrainingAggregator.restore(
+        str(tmp_path / 'single.json'))
+    assert state.latest == expected.latest
+    for user in range(20):
+        assert (state.by_type(f'user-{user}')
+                == expected.by_type(f'user-{user}'))
+
+
+def test_calculate_info_decimal():
+    from decimal import Decimal
+
+    info = homework.calculate_info('WLK', [9000, 1, 75, 180], 'decimal')
+    assert info.distance == Decimal('5.85'), (
+        'В режиме decimal значения и константы берутся из десятичной записи.'
+    )
+    assert info.get_message() == homework.read_package(
+        'WLK', [9000, 1, 75, 180]).show_training_info().get_message()
+    for workout_type, data in homework.DEMO_PACKAGES:
+        exact = homework.calculate_info(workout_type, data, 'decimal')
+        approx = homework.calculate_info(workout_type, data)
+        assert float(exact.calories) == pytest.approx(approx.calories,
+                                                      rel=1e-15)
+    with pytest.raises(ValueError):
+        homework.calculate_info('RUN', [15000, 1, 75], 'float16')
+
+
+def test_calculate_batch_float32():
+    np = pytest.importorskip('numpy')
+    result = homework.calculate_batch(
+        ['RUN', 'SWM', 'WLK'], [15000, 720, 9000], [1, 1, 1], [75, 80, 75],
+        height=[0, 0, 180], length_pool=[0, 25, 0], count_pool=[0, 40, 0],
+        dtype='float32',
+    )
+    assert result['calories'].dtype == np.float32
+    expected = [homework.read_package(*package).get_spent_calories()
+                for package in [('RUN', [15000, 1, 75]),
+                                ('SWM', [720, 1, 80, 25, 40]),
+                                ('WLK', [9000, 1, 75, 180])]]
+    assert list(result['calories']) == pytest.approx(expected, rel=1e-6)
+
+
+def test_PackageIndex(tmp_path):
+    import struct
+
+    path = str(tmp_path / 'packages.idx')
+    packages = homework.DEMO_PACKAGES + [('RUN', [15000.0, 1, 75])]
+    with homework.PackageIndex(path, capacity=100) as index:
+        messages = list(homework.iter_deduplicated(packages, index))
+        assert messages == [homework.calculate_info(*package)
+                            for package in homework.DEMO_PACKAGES], (
+            'Повтор пакета должен пропускаться.'
+        )
+        assert len(index) == 3
+        assert index.get('RUN', [15001, 1, 75]) is None
+        assert not index.add('SWM', [720, 1, 80, 25, 40], messages[0])
+    with homework.PackageIndex(path) as index:
+        assert len(index) == 3, 'Индекс должен сохраняться на диске.'
+        assert list(homework.iter_deduplicated(
+            homework.DEMO_PACKAGES, index)) == []
+        served = list(homework.iter_deduplicated(
+            homework.DEMO_PACKAGES, index, serve=True))
+        assert [message.get_message() for message in served] == [
+            homework.calculate_info(*package).get_message()
+            for package in homework.DEMO_PACKAGES
+        ]
+    with homework.PackageIndex(str(tmp_path / 'small.idx'), 2) as index:
+        index.add('RUN', [1, 1, 1], messages[1])
+        with pytest.raises(ValueError):
+            for action in range(2, 10):
+                index.add('RUN', [action, 1, 1], messages[1])
+    crashed = str(tmp_path / 'crashed.idx')
+    index = homework.PackageIndex(crashed, 3)
+    for action in range(1, 4):
+        index.add('RUN', [action, 1, 1], messages[1])
+    with open(crashed, 'rb') as source:
+        source.seek(len(homework.INDEX_MAGIC))
+        slots, count = struct.unpack('<QQ', source.read(16))
+    assert count == 3, 'Счётчик должен попадать в файл до flush.'
+    index._map.close()
+    index._file.close()
+    with open(crashed, 'r+b') as output:
+        output.seek(len(homework.INDEX_MAGIC) + 8)
+        output.write(struct.pack('<Q', 0))
+    with homework.PackageIndex(crashed) as index:
+        with pytest.raises(ValueError):
+            for action in range(4, 4 + slots):
+                index.add('RUN', [action, 1, 1], messages[1])
+            index.get('RUN', [100, 1, 1])
+    (tmp_path / 'bad.idx').write_bytes(b'not an index')
+    with pytest.raises(ValueError):
+        homework.PackageIndex(str(tmp_path / 'bad.idx'))
+
+
+def test_workload_generator(monkeypatch):
+    import argparse
+    from conftest import BASE_DIR
+
+    monkeypatch.syspath_prepend(str(BASE_DIR / 'benchmarks'))
+    workload = pytest.importorskip('workload')
+
+    def make():
+        return workload.PackageGenerator(
+            seed=22, mix={'RUN': 1, 'SWM': 1}, duplicate_ratio=0.2,
+            malformed_ratio=0.1)
+    lines = list(make().lines(5000))
+    assert lines == list(make().lines(5000)), (
+        'Поток с тем же seed должен повторяться.'
+    )
+    rejects = StringIO()
+    valid = list(homework.iter_valid_packages(lines, rejects))
+    assert 0.07 < 1 - len(valid) / len(lines) < 0.13
+    assert {workout_type for workout_type, _ in valid} == {'RUN', 'SWM'}
+    assert 0.15 < 1 - len(set(lines)) / len(lines) < 0.3
+    report = workload.replay(lines[:200], workload.local_target())
+    assert report['packages'] == 200
+    assert report['latency']['count'] == 200
+    assert not workload.local_target()('["RUN", [1' + '0' * 400 + ', 1, 1]]')
+    with pytest.raises(argparse.ArgumentTypeError):
+        workload.parse_value('weight=uniform:-10:0')
+    generator = workload.PackageGenerator(
+        mix={'RUN': 1}, values={'weight': ('normal', (-1000, 1))})
+    with pytest.raises(ValueError):
+        generator.package()